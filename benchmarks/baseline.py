@@ -0,0 +1,185 @@
+'''
+The list-based engines the bitboard ones replaced, kept as a baseline.
+
+`python -m benchmarks.engines --baseline` times them next to the current
+engines, and the tests check that both play the same games.
+'''
+from engines.base import Engine, IllegalMove
+from engines.connect4 import WIDTH, HEIGHT
+from engines.tictactoe import LINES
+
+# (row, col) steps of the four lines through a tile
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+class ListConnect4Engine(Engine):
+    '''
+    Connect 4 on a 7x6 board. Moves are column numbers, and rows are
+    numbered from the top.
+    '''
+
+    __slots__ = ('cells', 'heights', 'moves', '_turn', '_winner')
+
+    def __init__(self, turn=0):
+        self.cells = [None] * (WIDTH * HEIGHT)
+        self.heights = [0] * WIDTH
+        self.moves = 0
+        self._turn = turn
+        self._winner = None
+
+    @property
+    def turn(self):
+        return None if self.is_over() else self._turn
+
+    def get(self, row, col):
+        return self.cells[row * WIDTH + col]
+
+    def legal_moves(self):
+        if self.is_over():
+            return []
+        return [col for col in range(WIDTH) if self.heights[col] < HEIGHT]
+
+    def apply(self, col):
+        if self.is_over() or not 0 <= col < WIDTH or self.heights[col] >= HEIGHT:
+            raise IllegalMove(col)
+
+        row = HEIGHT - 1 - self.heights[col]
+        self.cells[row * WIDTH + col] = self._turn
+        self.heights[col] += 1
+        self.moves += 1
+
+        if self._connects(row, col):
+            self._winner = self._turn
+        else:
+            self._turn = 1 - self._turn
+
+    def winner(self):
+        return self._winner
+
+    def is_over(self):
+        return self._winner is not None or self.moves == WIDTH * HEIGHT
+
+    def clone(self):
+        engine = ListConnect4Engine.__new__(ListConnect4Engine)
+        engine.cells = self.cells[:]
+        engine.heights = self.heights[:]
+        engine.moves = self.moves
+        engine._turn = self._turn
+        engine._winner = self._winner
+        return engine
+
+    def serialize(self):
+        tiles = {None: '0', 0: '1', 1: '2'}
+        return {'board': ''.join(tiles[tile] for tile in self.cells), 'turn': self._turn}
+
+    @classmethod
+    def deserialize(cls, data):
+        engine = cls(data['turn'])
+        tiles = {'0': None, '1': 0, '2': 1}
+
+        engine.cells = [tiles[tile] for tile in data['board']]
+        engine.heights = [sum(1 for row in range(HEIGHT) if engine.get(row, col) is not None) for col in range(WIDTH)]
+        engine.moves = sum(engine.heights)
+
+        for index, tile in enumerate(engine.cells):
+            if tile is not None and engine._connects(index // WIDTH, index % WIDTH):
+                engine._winner = tile
+                break
+
+        return engine
+
+    def _connects(self, row, col):
+        '''
+        Whether the tile at (row, col) is part of four in a line.
+        '''
+        player = self.cells[row * WIDTH + col]
+
+        for dy, dx in DIRECTIONS:
+            count = 1
+            for sign in (1, -1):
+                y, x = row + dy * sign, col + dx * sign
+                while 0 <= y < HEIGHT and 0 <= x < WIDTH and self.cells[y * WIDTH + x] == player:
+                    count += 1
+                    y, x = y + dy * sign, x + dx * sign
+            if count >= 4:
+                return True
+
+        return False
+
+
+class ListTicTacToeEngine(Engine):
+    '''
+    Tic-tac-toe on a 3x3 board. Moves are cell indexes, row * 3 + col.
+    '''
+
+    __slots__ = ('cells', 'moves', '_turn', '_winner')
+
+    def __init__(self, turn=0):
+        self.cells = [None] * 9
+        self.moves = 0
+        self._turn = turn
+        self._winner = None
+
+    @property
+    def turn(self):
+        return None if self.is_over() else self._turn
+
+    def get(self, row, col):
+        return self.cells[row * 3 + col]
+
+    def legal_moves(self):
+        if self.is_over():
+            return []
+        return [cell for cell in range(9) if self.cells[cell] is None]
+
+    def apply(self, cell):
+        if self.is_over() or not 0 <= cell < 9 or self.cells[cell] is not None:
+            raise IllegalMove(cell)
+
+        self.cells[cell] = self._turn
+        self.moves += 1
+
+        if self._completes(cell):
+            self._winner = self._turn
+        else:
+            self._turn = 1 - self._turn
+
+    def winner(self):
+        return self._winner
+
+    def is_over(self):
+        return self._winner is not None or self.moves == 9
+
+    def clone(self):
+        engine = ListTicTacToeEngine.__new__(ListTicTacToeEngine)
+        engine.cells = self.cells[:]
+        engine.moves = self.moves
+        engine._turn = self._turn
+        engine._winner = self._winner
+        return engine
+
+    def serialize(self):
+        tiles = {None: '0', 0: '1', 1: '2'}
+        return {'board': ''.join(tiles[tile] for tile in self.cells), 'turn': self._turn}
+
+    @classmethod
+    def deserialize(cls, data):
+        engine = cls(data['turn'])
+        tiles = {'0': None, '1': 0, '2': 1}
+
+        engine.cells = [tiles[tile] for tile in data['board']]
+        engine.moves = sum(1 for tile in engine.cells if tile is not None)
+
+        for cell, tile in enumerate(engine.cells):
+            if tile is not None and engine._completes(cell):
+                engine._winner = tile
+                break
+
+        return engine
+
+    def _completes(self, cell):
+        player = self.cells[cell]
+        return any(
+            all(self.cells[other] == player for other in line)
+            for line in LINES if cell in line
+        )
@@ -0,0 +1,85 @@
+'''
+Compare get/set latency of the preference storage backends.
+
+    python -m benchmarks.database --sizes 1000 100000 1000000
+
+Every backend is filled with `size` players in a temporary directory, then
+`--ops` random reads and writes are timed. TinyDB scans its whole table on
+every read and rewrites its whole file on every write, so it runs fewer
+operations on large tables.
+'''
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from gamelib.database import TinyDatabase, SQLiteDatabase
+
+
+def prefs(id):
+    return {'id': id, 'connect4': {'emoji': '🟢', 'color': '255,0,0'}}
+
+
+def fill_tinydb(path, size):
+    db = TinyDatabase(path)
+    db.players.insert_multiple(prefs(id) for id in range(size))
+    return db
+
+
+def fill_sqlite(path, size):
+    db = SQLiteDatabase(path)
+    with db.conn:
+        db.conn.execute('BEGIN')
+        for id in range(size):
+            db.set_player_prefs(id, prefs(id))
+    return db
+
+
+BACKENDS = {
+    'tinydb': ('db.json', fill_tinydb),
+    'sqlite': ('db.sqlite3', fill_sqlite),
+}
+
+
+def measure(fn, ids):
+    start = time.perf_counter()
+    for id in ids:
+        fn(id)
+    return (time.perf_counter() - start) / len(ids)
+
+
+def run(backend, size, ops):
+    filename, fill = BACKENDS[backend]
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = fill(os.path.join(directory, filename), size)
+
+        # Full scans and rewrites make large TinyDB operations take seconds each
+        if backend == 'tinydb':
+            ops = max(3, min(ops, 10_000_000 // size))
+
+        get = measure(db.get_player_prefs, [random.randrange(size) for _ in range(ops)])
+        put = measure(lambda id: db.set_player_prefs(id, prefs(id)), [random.randrange(size) for _ in range(ops)])
+
+        db.close()
+
+    return get, put
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument('--ops', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'backend':<8} {'players':>10} {'get (us)':>12} {'set (us)':>12}")
+    for size in args.sizes:
+        for backend in args.backends:
+            get, put = run(backend, size, args.ops)
+            print(f'{backend:<8} {size:>10} {get * 1e6:>12.1f} {put * 1e6:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
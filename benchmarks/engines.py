@@ -0,0 +1,78 @@
+'''
+Measure how fast the game engines play random games.
+
+    python -m benchmarks.engines --games 10000 --engines connect4 tictactoe --baseline
+
+Every game is played from an empty board with uniformly random legal moves
+until it is over, without any Discord I/O. The time includes generating
+the legal moves, which is what a search does too. With `--baseline`, the
+list-based engines the bitboard ones replaced play the same games first.
+'''
+import time
+import random
+import argparse
+
+from engines.connect4 import Connect4Engine
+from engines.tictactoe import TicTacToeEngine
+from engines.game2048 import Game2048Engine
+
+from benchmarks.baseline import ListConnect4Engine, ListTicTacToeEngine
+
+
+def new_2048(rng):
+    engine = Game2048Engine(rng)
+    engine.insert_random()
+    engine.insert_random()
+    return engine
+
+
+ENGINES = {
+    'connect4': lambda rng: Connect4Engine(),
+    'tictactoe': lambda rng: TicTacToeEngine(),
+    '2048': new_2048,
+}
+
+BASELINES = {
+    'connect4': lambda rng: ListConnect4Engine(),
+    'tictactoe': lambda rng: ListTicTacToeEngine(),
+}
+
+
+def run(new, games, seed):
+    rng = random.Random(seed)
+    moves = 0
+
+    start = time.perf_counter()
+    for _ in range(games):
+        engine = new(rng)
+        while not engine.is_over():
+            engine.apply(rng.choice(engine.legal_moves()))
+            moves += 1
+    elapsed = time.perf_counter() - start
+
+    return moves, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', action='store_true', help='also time the list-based engines')
+    args = parser.parse_args()
+
+    print(f"{'engine':<10} {'version':<9} {'games':>8} {'moves':>10} {'moves/s':>12} {'us/move':>10}")
+    for name in args.engines:
+        games = args.games if name != '2048' else max(1, args.games // 20)
+
+        versions = [('current', ENGINES[name])]
+        if args.baseline and name in BASELINES:
+            versions.insert(0, ('baseline', BASELINES[name]))
+
+        for version, new in versions:
+            moves, elapsed = run(new, games, args.seed)
+            print(f'{name:<10} {version:<9} {games:>8} {moves:>10} {moves / elapsed:>12.0f} {elapsed / moves * 1e6:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
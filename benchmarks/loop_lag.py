@@ -0,0 +1,65 @@
+'''
+Measure event loop lag while preferences are written.
+
+    python -m benchmarks.loop_lag --players 20000 --writes 20
+
+Writes go through the TinyDB backend (which rewrites its whole file each
+time), first directly on the event loop and then through AsyncDatabase.
+'''
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+from gamelib.database import TinyDatabase, AsyncDatabase
+from gamelib.lag import LoopLagMonitor
+
+
+def prefs(id):
+    return {'id': id, 'connect4': {'emoji': '🟢', 'color': '255,0,0'}}
+
+
+async def measure(write, writes):
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    for id in range(writes):
+        await write(id)
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+
+    await asyncio.sleep(0.05)
+    monitor.stop()
+    return elapsed, monitor.stats()
+
+
+async def main(players, writes):
+    with tempfile.TemporaryDirectory() as directory:
+        backend = TinyDatabase(os.path.join(directory, 'db.json'))
+        backend.players.insert_multiple(prefs(id) for id in range(players))
+        storage = AsyncDatabase(backend)
+
+        async def blocking(id):
+            backend.set_player_prefs(id, prefs(id))
+
+        async def offloaded(id):
+            await storage.set_player_prefs(id, prefs(id))
+
+        print(f"{'mode':<10} {'total (s)':>10} {'avg lag (ms)':>14} {'max lag (ms)':>14}")
+        for name, write in [('blocking', blocking), ('async', offloaded)]:
+            elapsed, lag = await measure(write, writes)
+            print(f"{name:<10} {elapsed:>10.2f} {lag['avg'] * 1000:>14.1f} {lag['max'] * 1000:>14.1f}")
+
+        storage.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=20000)
+    parser.add_argument('--writes', type=int, default=20)
+    args = parser.parse_args()
+
+    asyncio.get_event_loop().run_until_complete(main(args.players, args.writes))
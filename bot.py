@@ -1,24 +1,54 @@
 import asyncio
 import signal
+import time
 import os
 
 import discord
 from discord.ext import commands
 
-from gamelib import registry, sessionManager, preferences
+from gamelib import db, writer, registry, sessionManager, preferences, renderer, remover, outbound, timers, resumer, looplag, metrics, profiler, compute
 from gamelib.utils import setupLogger, GameConfigError
+from gamelib.preferences import PreferenceError
 
 import games
 import settings
 
 PREFIX = 'g!'
 DISCORD_API_KEY = os.environ.get('DISCORD_API_KEY')
+# Import every game in the background once connected, set to 0 to import on first play
+PREWARM = os.environ.get('GAMEBOT_PREWARM', '1') != '0'
+# Prometheus metrics, as a text file rewritten every METRICS_INTERVAL seconds and/or on a local port
+METRICS_FILE = os.environ.get('GAMEBOT_METRICS_FILE')
+METRICS_PORT = os.environ.get('GAMEBOT_METRICS_PORT')
+METRICS_INTERVAL = 15
 
 
 class ModdedBot(commands.Bot):
     async def close(self, *args, **kwargs):
-        await sessionManager.killall()
-        await super().close(*args, **kwargs)
+        # Resumable sessions are saved as they are instead of being ended
+        resumer.stop()
+        saved = ()
+        try:
+            saved = await resumer.save()
+        except Exception:
+            logger.exception('Failed to save sessions, ending them instead')
+        finally:
+            await sessionManager.killall(keep=saved)
+            await renderer.flush(timeout=5)
+            # Removals go through the outbound queue, so they drain first
+            await remover.drain(timeout=5)
+            await outbound.drain(timeout=5)
+            remover.stop()
+            outbound.stop()
+            timers.stop()
+            looplag.stop()
+            metrics.stop()
+            compute.shutdown()
+            await writer.flush()
+            db.close()
+            if METRICS_FILE:
+                metrics.write(METRICS_FILE)
+            await super().close(*args, **kwargs)
 
 
 logger = setupLogger()
@@ -30,6 +60,38 @@ bot.remove_command('help')
 async def on_ready():
     logger.info(f'Logged on as {bot.user.name}')
 
+    looplag.start()
+    await resumer.load()
+    resumer.start()
+
+    if METRICS_PORT:
+        await metrics.serve(port=int(METRICS_PORT))
+    if METRICS_FILE and 'metrics' not in timers:
+        write_metrics()
+
+    if PREWARM:
+        await registry.prewarm()
+        report = ', '.join(f"{name} {'failed' if seconds is None else f'{seconds * 1000:.0f}ms'}" for name, seconds in registry.report().items())
+        logger.info(f'Games imported: {report}')
+
+
+def write_metrics():
+    timers.schedule('metrics', METRICS_INTERVAL, write_metrics)
+    try:
+        metrics.write(METRICS_FILE)
+    except OSError:
+        logger.exception('Failed to write metrics')
+
+
+@bot.before_invoke
+async def start_command_timer(ctx: commands.Context):
+    ctx.started = time.perf_counter()
+
+
+@bot.after_invoke
+async def record_command_time(ctx: commands.Context):
+    metrics.observe('command_seconds', time.perf_counter() - ctx.started, command=ctx.command.name)
+
 
 @bot.command('help')
 async def help(ctx: commands.Context):
@@ -61,8 +123,8 @@ async def play(ctx: commands.Context, game_name: str = ''):
         return await ctx.send(f"Usage: `g!play GAME [@opponent]`\nAvailable games are {', '.join(registry.all())}")
 
     # Make sure the game exists
-    game_cls = registry.get(game_name)
-    if not game_cls:
+    manifest = registry.manifest(game_name)
+    if not manifest:
         return await ctx.send(f'I don\'t know what that game is! Use `g!play` to list available games.')
 
     # Get the players
@@ -70,6 +132,18 @@ async def play(ctx: commands.Context, game_name: str = ''):
     if ctx.author not in players:
         players.insert(0, ctx.author)
 
+    # Check the number of players before loading the game
+    if len(players) < manifest.min_players:
+        return await ctx.send("Whoops: You didn't tell me who to play this game with!")
+
+    if manifest.max_players and len(players) > manifest.max_players:
+        return await ctx.send(f"Whoops: That's too many people! This game can only be played with {manifest.max_players} {'person' if manifest.max_players == 1 else 'people'}.")
+
+    # Imports the game the first time it's played
+    game_cls = registry.get(game_name)
+    if not game_cls:
+        return await ctx.send('Whoops: That game couldn\'t be loaded, try again later!')
+
     # Formatted list of people
     people = ' and '.join(map(lambda p: p.mention, players))
 
@@ -84,8 +158,9 @@ async def play(ctx: commands.Context, game_name: str = ''):
         return await ctx.send(f"Whoops: {err.message}")
 
     # Woohoo! let's get going
+    resumer.discard(players)
     sessionManager.add(players, game)
-    await game.begin()
+    await game.start()
 
 
 @bot.command('end', help='End an ongoing game')
@@ -98,7 +173,10 @@ async def end(ctx: commands.Context):
     # Formatted list of people
     people = ' and '.join(map(lambda p: p.mention, players))
 
-    # Find the session
+    # Find the session, bringing it back first if it was saved before a restart
+    if not sessionManager.get(players):
+        await resumer.resume_players(bot, players)
+
     game = sessionManager.pop(players)
     if not game:
         return await ctx.send(f'No game found with {people}')
@@ -113,29 +191,29 @@ async def get_prefs(ctx: commands.Context, app: str = None, key: str = None):
     try:
         # Dump all user settings
         if not app:
-            prefs = preferences.get_all(ctx.author)
+            prefs = await preferences.aget_all(ctx.author)
             msg = 'Your Preferences:\n'
             for app, settings in prefs.items():
                 if app != 'id':
                     msg += f'\n**__{app}__**'
                     for key, value in settings.items():
-                        msg += f'\n{key} = {value}'
+                        msg += f'\n{key} = {preferences.format(app, key, value)}'
 
             return await ctx.send(msg)
 
         # Make sure the game exists
-        if app != 'global' and not registry.get(app):
+        if app != 'global' and not registry.exists(app):
             return await ctx.send(f'I\'m not sure what app or game that is!')
 
         # Dump all settings for specified app
         if not key:
-            prefs = preferences.get_all_for_app(ctx.author, app)
+            prefs = await preferences.aget_all_for_app(ctx.author, app)
             msg = f"Your Preferences for **{app}**:\n"
             for key, value in prefs.items():
-                msg += f'\n{key} = {value}'
+                msg += f'\n{key} = {preferences.format(app, key, value)}'
             return await ctx.send(msg)
 
-        msg = f'{key} = {preferences.get(ctx.author, app, key)}'
+        msg = f'{key} = {preferences.format(app, key, await preferences.aget(ctx.author, app, key, guild=ctx.guild))}'
         await ctx.send(msg)
 
     except KeyError:
@@ -143,13 +221,13 @@ async def get_prefs(ctx: commands.Context, app: str = None, key: str = None):
 
 
 @bot.command('set', help='Customize game settings')
-async def set_prefs(ctx: commands.Context, app: str = None, key: str = None, value: str = None):
+async def set_prefs(ctx: commands.Context, app: str = None, key: str = None, *, value: str = None):
     # Check for app, or send usage
     if not app:
         return await ctx.send(f"Usage: `{PREFIX}set APP KEY VALUE` where APP is 'global' or a game name")
 
     # Make sure the game exists
-    if app != 'global' and not registry.get(app):
+    if app != 'global' and not registry.exists(app):
         return await ctx.send(f'I don\'t know what that app is!')
 
     # Validate key and value exist
@@ -164,14 +242,125 @@ async def set_prefs(ctx: commands.Context, app: str = None, key: str = None, val
     if not value:
         return await ctx.send(f'Value has to be specified')
 
+    # Convert the value once, games read it as is
+    try:
+        value = preferences.parse(app, key, value)
+    except PreferenceError as err:
+        return await ctx.send(err.message)
+
     # Set the settings
-    preferences.set(ctx.author, app, key, value)
-    await ctx.send(f'{key} = {value}')
+    prefs = await preferences.aset(ctx.author, app, key, value)
+    await ctx.send(f'{key} = {preferences.format(app, key, value)}')
 
-    # Notify apps
+    # Update running games' copies, then notify them
     sessions = sessionManager.get_player_sessions(ctx.author)
     for app in sessions:
-        await app.handle('preference_change', user=ctx.author)
+        app.push_preferences(ctx.author, prefs)
+        sessionManager.dispatch(app, 'preference_change', user=ctx.author)
+
+
+@bot.command('default', help='Set a server\'s default game settings')
+async def set_default(ctx: commands.Context, app: str = None, key: str = None, *, value: str = None):
+    # Check for app, or send usage
+    if not app:
+        return await ctx.send(f"Usage: `{PREFIX}default APP KEY VALUE` where APP is 'global' or a game name, and VALUE can be 'reset'")
+
+    # Defaults belong to a server, and only its managers can change them
+    if not ctx.guild:
+        return await ctx.send('Defaults can only be set in a server!')
+
+    if not ctx.author.guild_permissions.manage_guild:
+        return await ctx.send('You need the Manage Server permission to change defaults!')
+
+    # Make sure the game and setting exist
+    if app != 'global' and not registry.exists(app):
+        return await ctx.send(f'I don\'t know what that app is!')
+
+    if not key or not preferences.exists(app, key):
+        return await ctx.send('That app / key combo cannot be customized! Are you sure that setting exists?')
+
+    # Show the current default
+    if not value:
+        current = (await preferences.aget_guild(ctx.guild)).get(app, {}).get(key)
+        return await ctx.send(f'{key} = {preferences.format(app, key, current)}')
+
+    try:
+        value = None if value == 'reset' else preferences.parse(app, key, value)
+    except PreferenceError as err:
+        return await ctx.send(err.message)
+
+    guild_prefs = await preferences.aset_guild(ctx.guild, app, key, value)
+    await ctx.send(f'Default {key} = {preferences.format(app, key, value)}')
+
+    # Update every game running in the server
+    for app in sessionManager.get_guild_sessions(ctx.guild):
+        app.push_guild_preferences(guild_prefs)
+        sessionManager.dispatch(app, 'preference_change', user=None)
+
+
+@bot.command('stats', help='Show bot latency stats (owner only)')
+async def stats(ctx: commands.Context):
+    if not await bot.is_owner(ctx.author):
+        return await ctx.send('Only the bot\'s owner can see its stats!')
+
+    def ms(seconds):
+        return f'{seconds * 1000:.0f}ms'
+
+    def table(title, name):
+        rows = [f'{title:<16}{"count":>7}{"p50":>8}{"p95":>8}{"p99":>8}']
+        for labels, histogram in sorted(metrics.histograms(name).items()):
+            label = ','.join(str(value) for _, value in labels)
+            rows.append(f'{label:<16}{histogram.count:>7}' + ''.join(f'{ms(histogram.quantile(q)):>8}' for q in (0.5, 0.95, 0.99)))
+        return '\n'.join(rows)
+
+    counts = sessionManager.counts()
+    lag = looplag.stats()
+    per_game = ', '.join(f'{game} {count}' for game, count in counts['games'].items())
+
+    msg = f"Sessions: {counts['sessions']}" + (f' ({per_game})' if per_game else '')
+    msg += f"\nLoop lag: avg {ms(lag['avg'])}, max {ms(lag['max'])}"
+    for game, mailbox in sorted(sessionManager.mailbox_stats().items()):
+        msg += f"\nMailbox {game}: {mailbox['depth']} waiting, deepest {mailbox['depth_max']}, {mailbox['shed']} shed"
+    msg += '\n```\n' + '\n\n'.join([
+        table('Command', 'command_seconds'),
+        table('Game', 'handle_seconds'),
+        table('Discord API', 'api_seconds'),
+        table('Database', 'db_seconds'),
+    ]) + '\n```'
+
+    await ctx.send(msg)
+
+
+@bot.command('profile', help='Profile a game or a session (owner only)')
+async def profile(ctx: commands.Context, target: str = None, seconds: float = 30):
+    if not await bot.is_owner(ctx.author):
+        return await ctx.send('Only the bot\'s owner can profile games!')
+
+    if not target:
+        return await ctx.send(f'Usage: `{PREFIX}profile GAME|@player SECONDS`')
+
+    # A game name, or the sessions of the mentioned players
+    game = None if ctx.message.mentions else target
+    sessions = set()
+    for player in ctx.message.mentions:
+        sessions |= sessionManager.get_player_sessions(player)
+
+    if game and not registry.exists(game):
+        return await ctx.send('I don\'t know what that game is!')
+
+    if not game and not sessions:
+        return await ctx.send('Those players aren\'t playing anything!')
+
+    seconds = min(max(seconds, 1), 300)
+    await ctx.send(f'Profiling {game or "their sessions"} for {seconds:g}s...')
+
+    try:
+        path, summary = await profiler.profile(seconds, game=game, sessions=sessions)
+    except RuntimeError as err:
+        return await ctx.send(str(err))
+
+    # Keep the summary within a message
+    await ctx.send(f'Saved `{path}`\n```\n{summary[:1900]}\n```')
 
 
 @bot.event
@@ -187,9 +376,22 @@ async def on_reaction_add(reaction: discord.Reaction, user):
     # Notify app about reaction
     if app:
         if sessions and app in sessions:
-            await app.handle('reaction', reaction=reaction, user=user)
+            if not sessionManager.dispatch(app, 'reaction', reaction=reaction, user=user):
+                remover.remove(reaction, user)
         else:
-            await reaction.remove(user)
+            remover.remove(reaction, user)
+
+
+@bot.event
+async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
+    # Messages of sessions saved before a restart aren't cached, so their
+    # reactions only show up as raw events
+    if payload.user_id == bot.user.id or not resumer.tracks(payload.message_id):
+        return
+
+    reaction, user = await resumer.reaction(bot, payload)
+    if reaction:
+        await on_reaction_add(reaction, user)
 
 
 if not DISCORD_API_KEY:
@@ -0,0 +1,6 @@
+'''
+Game rules without Discord I/O, see engines.base.
+
+Nothing in here imports gamelib or games, so benchmarks, tools and compute
+workers can use the engines without setting up the bot (or its database).
+'''
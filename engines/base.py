@@ -0,0 +1,67 @@
+from abc import ABCMeta, abstractmethod
+
+
+class IllegalMove(ValueError):
+    pass
+
+
+class Engine(metaclass=ABCMeta):
+    '''
+    A game's rules and state, without any Discord I/O.
+
+    Engines are synchronous and know nothing about users: players are
+    numbered from 0 in turn order, and the `BaseBotApp` adapter maps them
+    to users and renders the state. That keeps them cheap to simulate,
+    search, benchmark and copy.
+    '''
+
+    __slots__ = ()
+
+    @property
+    @abstractmethod
+    def turn(self):
+        '''
+        Index of the player to move, or None once the game is over.
+        '''
+        raise NotImplementedError
+
+    @abstractmethod
+    def legal_moves(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def apply(self, move):
+        '''
+        Play `move` for the current player. Raises IllegalMove.
+        '''
+        raise NotImplementedError
+
+    @abstractmethod
+    def winner(self):
+        '''
+        Index of the player who won, or None (still playing, or a draw).
+        '''
+        raise NotImplementedError
+
+    @abstractmethod
+    def is_over(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def clone(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def serialize(self):
+        '''
+        The state as JSON-serializable data, for `deserialize`.
+        '''
+        raise NotImplementedError
+
+    @classmethod
+    @abstractmethod
+    def deserialize(cls, data):
+        raise NotImplementedError
+
+    def is_draw(self):
+        return self.is_over() and self.winner() is None
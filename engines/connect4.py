@@ -0,0 +1,113 @@
+from engines.base import Engine, IllegalMove
+
+WIDTH = 7
+HEIGHT = 6
+# Each column takes HEIGHT + 1 bits, bottom row first. The spare bit on top
+# keeps lines from wrapping into the next column.
+STRIDE = HEIGHT + 1
+# Bit shifts to the next tile of a vertical, horizontal and the two diagonal lines
+SHIFTS = (1, STRIDE, STRIDE - 1, STRIDE + 1)
+BOTTOM = [col * STRIDE for col in range(WIDTH)]
+TOP = [col * STRIDE + HEIGHT for col in range(WIDTH)]
+
+
+def connects(mask):
+    '''
+    Whether a player's mask has four in a line.
+    '''
+    for shift in SHIFTS:
+        pairs = mask & (mask >> shift)
+        if pairs & (pairs >> 2 * shift):
+            return True
+    return False
+
+
+class Connect4Engine(Engine):
+    '''
+    Connect 4 on a 7x6 board. Moves are column numbers, and rows are
+    numbered from the top.
+
+    The board is a bitboard: a mask of each player's tiles, and the bit
+    the next tile in each column goes to.
+    '''
+
+    __slots__ = ('masks', 'heights', 'moves', '_turn', '_winner')
+
+    def __init__(self, turn=0):
+        self.masks = [0, 0]
+        self.heights = BOTTOM[:]
+        self.moves = 0
+        self._turn = turn
+        self._winner = None
+
+    @property
+    def turn(self):
+        return None if self.is_over() else self._turn
+
+    def get(self, row, col):
+        bit = 1 << (col * STRIDE + HEIGHT - 1 - row)
+        if self.masks[0] & bit:
+            return 0
+        if self.masks[1] & bit:
+            return 1
+        return None
+
+    def legal_moves(self):
+        if self.is_over():
+            return []
+        return [col for col in range(WIDTH) if self.heights[col] != TOP[col]]
+
+    def apply(self, col):
+        if self.is_over() or not 0 <= col < WIDTH or self.heights[col] == TOP[col]:
+            raise IllegalMove(col)
+
+        mask = self.masks[self._turn] | 1 << self.heights[col]
+        self.masks[self._turn] = mask
+        self.heights[col] += 1
+        self.moves += 1
+
+        if connects(mask):
+            self._winner = self._turn
+        else:
+            self._turn = 1 - self._turn
+
+    def winner(self):
+        return self._winner
+
+    def is_over(self):
+        return self._winner is not None or self.moves == WIDTH * HEIGHT
+
+    def clone(self):
+        engine = Connect4Engine.__new__(Connect4Engine)
+        engine.masks = self.masks[:]
+        engine.heights = self.heights[:]
+        engine.moves = self.moves
+        engine._turn = self._turn
+        engine._winner = self._winner
+        return engine
+
+    def serialize(self):
+        tiles = {None: '0', 0: '1', 1: '2'}
+        board = ''.join(tiles[self.get(row, col)] for row in range(HEIGHT) for col in range(WIDTH))
+        return {'board': board, 'turn': self._turn}
+
+    @classmethod
+    def deserialize(cls, data):
+        engine = cls(data['turn'])
+
+        for index, tile in enumerate(data['board']):
+            if tile != '0':
+                row, col = divmod(index, WIDTH)
+                engine.masks[int(tile) - 1] |= 1 << (col * STRIDE + HEIGHT - 1 - row)
+
+        for col in range(WIDTH):
+            while engine.heights[col] != TOP[col] and (engine.masks[0] | engine.masks[1]) >> engine.heights[col] & 1:
+                engine.heights[col] += 1
+
+        engine.moves = sum(height - bottom for height, bottom in zip(engine.heights, BOTTOM))
+
+        for player in (0, 1):
+            if connects(engine.masks[player]):
+                engine._winner = player
+
+        return engine
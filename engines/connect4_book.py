@@ -0,0 +1,116 @@
+'''
+Connect 4 opening book: the best move for early positions, looked up in
+a sorted binary file through mmap.
+
+The file is a header followed by fixed-size records of a position key and
+a column, sorted by key. Positions and their mirror images share a record,
+stored under the smaller of their two keys. Build it with
+`python -m tools.connect4_book`.
+'''
+import os
+import mmap
+import struct
+
+from engines.connect4 import WIDTH, STRIDE
+
+MAGIC = b'C4BOOK1\0'
+HEADER = struct.Struct('<8sII')
+RECORD = struct.Struct('<QB')
+COLUMN = (1 << STRIDE) - 1
+
+
+def position_key(masks, turn):
+    '''
+    A number unique to the position: the player to move's tiles plus every
+    tile. A column of height h sums to something in [2^h - 1, 2^(h+1) - 2],
+    so no two columns' contents give the same bits, and none carry into the
+    next column.
+    '''
+    return masks[turn] + (masks[0] | masks[1])
+
+
+def mirror(key):
+    '''
+    The key of the position reflected left to right.
+    '''
+    mirrored = 0
+    for col in range(WIDTH):
+        mirrored |= (key >> col * STRIDE & COLUMN) << (WIDTH - 1 - col) * STRIDE
+    return mirrored
+
+
+def canonical(engine):
+    '''
+    The key to look a position up with, and whether it is the mirrored one
+    (so the book's column has to be mirrored back).
+    '''
+    key = position_key(engine.masks, engine.turn)
+    flipped = mirror(key)
+    return (flipped, True) if flipped < key else (key, False)
+
+
+def write(path, entries, plies):
+    '''
+    Write {canonical key: column} as a book covering the first `plies` moves.
+    '''
+    tmp = path + '.tmp'
+
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(entries), plies))
+        for key in sorted(entries):
+            f.write(RECORD.pack(key, entries[key]))
+        # On disk before it replaces the old book
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp, path)
+
+
+class OpeningBook:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count, self.plies = HEADER.unpack_from(self._map)
+        if magic != MAGIC or len(self._map) != HEADER.size + self.count * RECORD.size:
+            self._map.close()
+            raise ValueError(f'{path} is not a connect 4 opening book')
+
+    @classmethod
+    def open(cls, path):
+        '''
+        The book at `path`, or None if there isn't one.
+        '''
+        try:
+            return cls(path)
+        except FileNotFoundError:
+            return None
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, engine):
+        '''
+        The book's column for the engine's position, or None.
+        '''
+        if engine.moves > self.plies or engine.is_over():
+            return None
+
+        key, flipped = canonical(engine)
+        low, high = 0, self.count
+
+        while low < high:
+            middle = (low + high) // 2
+            found, col = RECORD.unpack_from(self._map, HEADER.size + middle * RECORD.size)
+
+            if found == key:
+                return WIDTH - 1 - col if flipped else col
+            if found < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        return None
+
+    def close(self):
+        self._map.close()
@@ -0,0 +1,230 @@
+'''
+Negamax search with alpha-beta pruning for Connect4Engine.
+
+The search works on copies of the engine's bitboards and undoes its own
+moves, iteratively deepening until it runs out of depth or time. Results
+are kept in a fixed-size transposition table keyed by Zobrist hashes, and
+the best move it stored for a position is tried first next time.
+'''
+import time
+import random
+
+from engines.connect4 import WIDTH, HEIGHT, STRIDE, TOP, connects
+
+# Columns from the middle out, which are usually the better moves
+ORDER = (3, 2, 4, 1, 5, 0, 6)
+# Every playable bit, and the middle column's
+BOARD = sum(((1 << HEIGHT) - 1) << col * STRIDE for col in range(WIDTH))
+CENTER = ((1 << HEIGHT) - 1) << 3 * STRIDE
+# Winning sooner scores higher, and every win outscores any evaluation
+WIN = 1000
+SOLVED = WIN - WIDTH * HEIGHT
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Fixed seed, so keys are the same in every process
+_keys = random.Random(0x4c4)
+ZOBRIST = [[_keys.getrandbits(64) for _ in range(WIDTH * STRIDE)] for _ in range(2)]
+SIDE = _keys.getrandbits(64)
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+def threats(mask, empty):
+    '''
+    Empty cells that would complete four in a line for `mask`.
+    '''
+    found = (mask << 1) & (mask << 2) & (mask << 3)
+
+    for shift in (STRIDE, STRIDE - 1, STRIDE + 1):
+        pairs = (mask << shift) & (mask << 2 * shift)
+        found |= pairs & (mask << 3 * shift)
+        found |= pairs & (mask >> shift)
+        pairs = (mask >> shift) & (mask >> 2 * shift)
+        found |= pairs & (mask << shift)
+        found |= pairs & (mask >> 3 * shift)
+
+    return found & empty
+
+
+def key(engine):
+    '''
+    Zobrist hash of an engine's position and player to move.
+    '''
+    hashed = SIDE if engine.turn else 0
+
+    for player, mask in enumerate(engine.masks):
+        for bit in range(WIDTH * STRIDE):
+            if mask >> bit & 1:
+                hashed ^= ZOBRIST[player][bit]
+
+    return hashed
+
+
+class TranspositionTable:
+    '''
+    A fixed number of slots indexed by the low bits of the key. A slot is
+    only overwritten by a result searched as deep, or if it was stored by
+    an earlier search, so it never grows and stale results age out.
+    '''
+
+    def __init__(self, bits=17):
+        self.mask = (1 << bits) - 1
+        self.slots = [None] * (1 << bits)
+        self.generation = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def get(self, hashed):
+        entry = self.slots[hashed & self.mask]
+        if entry is not None and entry[0] == hashed:
+            return entry
+        return None
+
+    def put(self, hashed, depth, flag, value, move):
+        index = hashed & self.mask
+        entry = self.slots[index]
+
+        if entry is None or entry[5] != self.generation or depth >= entry[1]:
+            self.slots[index] = (hashed, depth, flag, value, move, self.generation)
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+class Searcher:
+    # Nodes searched between looking at the clock, minus one
+    CHECK_EVERY = 1023
+
+    def __init__(self, table=None):
+        self.table = table or TranspositionTable()
+        self.nodes = 0
+
+    def search(self, engine, max_depth, budget):
+        '''
+        The best move found for the player to move within `max_depth` plies
+        and `budget` seconds, and the depth that was completed.
+        '''
+        self.deadline = time.perf_counter() + budget
+        self.nodes = 0
+        self.table.new_search()
+
+        legal = engine.legal_moves()
+        best = min(legal, key=ORDER.index)
+        reached = 0
+
+        for depth in range(1, max_depth + 1):
+            self.masks = engine.masks[:]
+            self.heights = engine.heights[:]
+            self.moves = engine.moves
+
+            try:
+                score, move = self._negamax(engine.turn, key(engine), depth, -WIN, WIN)
+            except _OutOfTime:
+                break
+
+            best, reached = move, depth
+
+            # Stop once the result is a forced win or loss, or the game can't go any further
+            if abs(score) >= SOLVED or engine.moves + depth >= WIDTH * HEIGHT:
+                break
+
+        return best, reached
+
+    def _negamax(self, player, hashed, depth, alpha, beta):
+        self.nodes += 1
+        if not self.nodes & self.CHECK_EVERY and time.perf_counter() > self.deadline:
+            raise _OutOfTime()
+
+        if self.moves == WIDTH * HEIGHT:
+            return 0, None
+
+        masks, heights = self.masks, self.heights
+        mine = masks[player]
+
+        # A move that wins now is the best there is
+        for col in ORDER:
+            if heights[col] != TOP[col] and connects(mine | 1 << heights[col]):
+                return WIN - self.moves - 1, col
+
+        if depth == 0:
+            return self._evaluate(player), None
+
+        start = alpha
+        first = None
+
+        entry = self.table.get(hashed)
+        if entry is not None:
+            first = entry[4]
+            if entry[1] >= depth:
+                flag, value = entry[2], entry[3]
+                if flag == EXACT:
+                    return value, first
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value, first
+
+        order = ORDER if first is None else (first,) + tuple(col for col in ORDER if col != first)
+        best, best_move = -WIN, None
+
+        for col in order:
+            bit = heights[col]
+            if bit == TOP[col]:
+                continue
+
+            masks[player] = mine | 1 << bit
+            heights[col] += 1
+            self.moves += 1
+
+            score = -self._negamax(1 - player, hashed ^ ZOBRIST[player][bit] ^ SIDE, depth - 1, -beta, -alpha)[0]
+
+            masks[player] = mine
+            heights[col] -= 1
+            self.moves -= 1
+
+            if score > best:
+                best, best_move = score, col
+            if best > alpha:
+                alpha = best
+            if alpha >= beta:
+                break
+
+        flag = UPPER if best <= start else LOWER if best >= beta else EXACT
+        self.table.put(hashed, depth, flag, best, best_move)
+
+        return best, best_move
+
+    def _evaluate(self, player):
+        '''
+        Score for the player to move: open threes count most, then tiles
+        in the middle column.
+        '''
+        mine, theirs = self.masks[player], self.masks[1 - player]
+        empty = BOARD & ~(mine | theirs)
+
+        return (
+            4 * (popcount(threats(mine, empty)) - popcount(threats(theirs, empty)))
+            + popcount(mine & CENTER) - popcount(theirs & CENTER)
+        )
+
+
+_searcher = None
+
+
+def best_move(engine, max_depth, budget):
+    '''
+    Entry point for compute workers. Each worker keeps its searcher, and so
+    its transposition table, between calls.
+    '''
+    global _searcher
+    if _searcher is None:
+        _searcher = Searcher()
+
+    return _searcher.search(engine, max_depth, budget)
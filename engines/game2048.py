@@ -0,0 +1,128 @@
+import random
+
+from engines.base import Engine, IllegalMove
+
+MOVES = ('LEFT', 'RIGHT', 'UP', 'DOWN')
+# Cell indexes of every line a move slides, starting from the edge tiles slide towards
+LINES = {
+    'LEFT': tuple(tuple(row * 4 + col for col in range(4)) for row in range(4)),
+    'RIGHT': tuple(tuple(row * 4 + col for col in reversed(range(4))) for row in range(4)),
+    'UP': tuple(tuple(row * 4 + col for row in range(4)) for col in range(4)),
+    'DOWN': tuple(tuple(row * 4 + col for row in reversed(range(4))) for col in range(4)),
+}
+
+
+def slide(tiles):
+    '''
+    Slide a line of tiles towards its start, merging equal pairs once.
+    Returns the new line and the points scored.
+    '''
+    tiles = [tile for tile in tiles if tile]
+    line = []
+    score = 0
+    i = 0
+
+    while i < len(tiles):
+        if i + 1 < len(tiles) and tiles[i] == tiles[i + 1]:
+            line.append(tiles[i] * 2)
+            score += tiles[i] * 2
+            i += 2
+        else:
+            line.append(tiles[i])
+            i += 1
+
+    return line + [0] * (4 - len(line)), score
+
+
+class Game2048Engine(Engine):
+    '''
+    A single player's 2048 board. Moves are 'LEFT', 'RIGHT', 'UP' and
+    'DOWN'; a move that changes the board adds a random tile. There is no
+    winner, the score is the result.
+    '''
+
+    __slots__ = ('cells', 'score', 'random')
+
+    def __init__(self, rng=random):
+        self.cells = [0] * 16
+        self.score = 0
+        self.random = rng
+
+    @property
+    def turn(self):
+        return None if self.is_over() else 0
+
+    def get(self, row, col):
+        return self.cells[row * 4 + col]
+
+    def legal_moves(self):
+        return [move for move in MOVES if self._moved(move)[0] != self.cells]
+
+    def apply(self, move):
+        if move not in LINES:
+            raise IllegalMove(move)
+
+        cells, score = self._moved(move)
+        if cells == self.cells:
+            raise IllegalMove(move)
+
+        self.cells = cells
+        self.score += score
+        self.insert_random()
+
+    def winner(self):
+        return None
+
+    def is_over(self):
+        return 0 not in self.cells and not self.legal_moves()
+
+    def insert_random(self):
+        '''
+        Put a 2 (or sometimes a 4) on a random empty cell. Returns False if
+        the board is full.
+        '''
+        num = self.random.choice([2, 2, 4])
+        choices = [cell for cell in range(16) if not self.cells[cell]]
+
+        if not choices:
+            return False
+
+        self.cells[self.random.choice(choices)] = num
+        return True
+
+    def fill(self):
+        while self.insert_random():
+            pass
+
+    def clone(self):
+        engine = Game2048Engine.__new__(Game2048Engine)
+        engine.cells = self.cells[:]
+        engine.score = self.score
+
+        # Clones roll their own tiles, without moving the original's RNG
+        engine.random = random.Random()
+        engine.random.setstate(self.random.getstate())
+
+        return engine
+
+    def serialize(self):
+        return {'board': self.cells[:], 'score': self.score}
+
+    @classmethod
+    def deserialize(cls, data, rng=random):
+        engine = cls(rng)
+        engine.cells = list(data['board'])
+        engine.score = data['score']
+        return engine
+
+    def _moved(self, move):
+        cells = self.cells[:]
+        score = 0
+
+        for line in LINES[move]:
+            tiles, points = slide([self.cells[cell] for cell in line])
+            score += points
+            for cell, tile in zip(line, tiles):
+                cells[cell] = tile
+
+        return cells, score
@@ -0,0 +1,145 @@
+from engines.base import Engine, IllegalMove
+
+# Cell indexes of every row, column and diagonal
+LINES = (
+    (0, 1, 2), (3, 4, 5), (6, 7, 8),
+    (0, 3, 6), (1, 4, 7), (2, 5, 8),
+    (0, 4, 8), (2, 4, 6),
+)
+FULL = 0b111111111
+# WINNING[mask] is whether a player's 9-bit mask has three in a line
+WINNING = bytes(any(mask & line == line for line in (sum(1 << cell for cell in cells) for cells in LINES)) for mask in range(1 << 9))
+
+
+def _solve(table, mine, theirs):
+    '''
+    Minimax value for the player to move (1 win, 0 draw, -1 loss) of every
+    position reachable from (mine, theirs), into `table` with the moves
+    that keep that value.
+    '''
+    key = mine | theirs << 9
+    if key in table:
+        return table[key][0]
+
+    if WINNING[theirs]:
+        table[key] = (-1, ())
+        return -1
+    if mine | theirs == FULL:
+        table[key] = (0, ())
+        return 0
+
+    values = {}
+    for cell in range(9):
+        if not (mine | theirs) >> cell & 1:
+            values[cell] = -_solve(table, theirs, mine | 1 << cell)
+
+    value = max(values.values())
+    table[key] = (value, tuple(cell for cell in values if values[cell] == value))
+    return value
+
+
+# {player to move's mask | other player's mask << 9: (value, best moves)}
+# for all 5478 positions a game can reach
+TABLE = {}
+_solve(TABLE, 0, 0)
+
+
+class TicTacToeEngine(Engine):
+    '''
+    Tic-tac-toe on a 3x3 board. Moves are cell indexes, row * 3 + col.
+
+    Each player's tiles are a 9-bit mask. Every reachable position is
+    solved when the module is imported, so `value` and `best_moves` are a
+    dict lookup.
+    '''
+
+    __slots__ = ('masks', 'moves', '_turn', '_winner')
+
+    def __init__(self, turn=0):
+        self.masks = [0, 0]
+        self.moves = 0
+        self._turn = turn
+        self._winner = None
+
+    @property
+    def turn(self):
+        return None if self.is_over() else self._turn
+
+    def get(self, row, col):
+        bit = 1 << (row * 3 + col)
+        if self.masks[0] & bit:
+            return 0
+        if self.masks[1] & bit:
+            return 1
+        return None
+
+    def legal_moves(self):
+        if self.is_over():
+            return []
+        taken = self.masks[0] | self.masks[1]
+        return [cell for cell in range(9) if not taken >> cell & 1]
+
+    def apply(self, cell):
+        if self.is_over() or not 0 <= cell < 9 or (self.masks[0] | self.masks[1]) >> cell & 1:
+            raise IllegalMove(cell)
+
+        mask = self.masks[self._turn] | 1 << cell
+        self.masks[self._turn] = mask
+        self.moves += 1
+
+        if WINNING[mask]:
+            self._winner = self._turn
+        else:
+            self._turn = 1 - self._turn
+
+    def winner(self):
+        return self._winner
+
+    def is_over(self):
+        return self._winner is not None or self.moves == 9
+
+    def value(self):
+        '''
+        1 if the player to move can force a win, 0 a draw, -1 a loss, in a
+        game that isn't over.
+        '''
+        return TABLE[self._key()][0]
+
+    def best_moves(self):
+        '''
+        Every move that keeps the best result for the player to move.
+        '''
+        if self.is_over():
+            return []
+        return list(TABLE[self._key()][1])
+
+    def clone(self):
+        engine = TicTacToeEngine.__new__(TicTacToeEngine)
+        engine.masks = self.masks[:]
+        engine.moves = self.moves
+        engine._turn = self._turn
+        engine._winner = self._winner
+        return engine
+
+    def serialize(self):
+        tiles = {None: '0', 0: '1', 1: '2'}
+        return {'board': ''.join(tiles[self.get(cell // 3, cell % 3)] for cell in range(9)), 'turn': self._turn}
+
+    @classmethod
+    def deserialize(cls, data):
+        engine = cls(data['turn'])
+
+        for cell, tile in enumerate(data['board']):
+            if tile != '0':
+                engine.masks[int(tile) - 1] |= 1 << cell
+
+        engine.moves = bin(engine.masks[0] | engine.masks[1]).count('1')
+
+        for player in (0, 1):
+            if WINNING[engine.masks[player]]:
+                engine._winner = player
+
+        return engine
+
+    def _key(self):
+        return self.masks[self._turn] | self.masks[1 - self._turn] << 9
@@ -1,17 +1,75 @@
-from .database import Database
-from .preferences import Preferences
+import os
+
+from .database import Database, AsyncDatabase, WriteBehind, open_database
+from .preferences import Preferences, Color, Emoji, GLOBAL
 from .session import SessionManager
 from .registry import Registry
+from .outbound import OutboundScheduler
+from .render import RenderScheduler
+from .controls import ControlInstaller
+from .removal import ReactionRemover
+from .timers import TimingWheel
+from .snapshot import SnapshotStore, Resumer
+from .lag import LoopLagMonitor
+from .metrics import Metrics
+from .profiler import Profiler
+from .compute import ComputePool
 
-db = Database()
-preferences = Preferences(db)
-sessionManager = SessionManager(db)
+metrics = Metrics()
+timers = TimingWheel()
+db = AsyncDatabase(open_database(os.environ.get('GAMEBOT_DATABASE', 'tinydb:db.json')), metrics)
+writer = WriteBehind(db, timers)
+preferences = Preferences(db, writer)
+preferences.register(GLOBAL, {
+    'emoji': Emoji('Game piece emoji, in every game'),
+    'color': Color('Message embed color, in every game'),
+})
 registry = Registry()
+outbound = OutboundScheduler(metrics)
+renderer = RenderScheduler(outbound)
+controls = ControlInstaller(outbound)
+remover = ReactionRemover(outbound)
+sessionManager = SessionManager(db, timers, remover, metrics)
+looplag = LoopLagMonitor()
+profiler = Profiler(os.environ.get('GAMEBOT_PROFILE_DIR', 'profiles'))
+compute = ComputePool(int(os.environ.get('GAMEBOT_COMPUTE_WORKERS', '2')), metrics)
+resumer = Resumer(SnapshotStore('sessions.json'), sessionManager, registry, timers)
+
+metrics.collect('sessions', lambda: sessionManager.counts()['games'], label='game')
+metrics.collect('sessions_total', lambda: len(sessionManager))
+metrics.collect('mailbox', sessionManager.mailbox_stats, label='game')
+metrics.collect('outbound', outbound.stats, label='priority')
+metrics.collect('renderer', renderer.stats)
+metrics.collect('playable_seconds', controls.stats, label='game')
+metrics.collect('remover', remover.stats)
+metrics.collect('loop_lag_seconds', looplag.stats)
+metrics.collect('timers', lambda: len(timers))
+metrics.collect('writer', writer.stats)
+metrics.collect('preference_cache', preferences.cache.stats)
+metrics.collect('preference_resolved_cache', preferences.resolved.stats)
+metrics.collect('compute', compute.stats)
+metrics.collect('resumer', lambda: {'resumed': resumer.resumed, 'failed': resumer.failed})
+
+
+def declare(name, module, players=(1, None), prefs=None):
+    '''
+    Add a game to the manifest without importing it. `players` is the
+    (min, max) number of players, where max None is any number.
+    '''
+    registry.declare(name, module, players)
+    if prefs:
+        preferences.register(name, prefs)
+
 
+def register(name, prefs=None, idle_timeout=None, max_duration=None):
+    def decorator(cls):
+        if idle_timeout is not None:
+            cls.IDLE_TIMEOUT = idle_timeout
+        if max_duration is not None:
+            cls.MAX_DURATION = max_duration
 
-def register(name, prefs=None):
-    def decorator(func):
-        registry.register(name, func)
+        registry.register(name, cls)
         if prefs:
             preferences.register(name, prefs)
+        return cls
     return decorator
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger('bot')
+
+
+class Actor:
+    '''
+    A bounded mailbox and worker task for a single session.
+
+    Events posted to an actor are handled one at a time and in order, so a
+    game never runs two `handle` calls concurrently. Different sessions each
+    have their own actor and run in parallel.
+    '''
+
+    MAILBOX_SIZE = 32
+
+    def __init__(self, app, size=None, metrics=None):
+        self.app = app
+        self.metrics = metrics
+        self.mailbox = asyncio.Queue(maxsize=size or self.MAILBOX_SIZE)
+        self.closed = False
+        self.busy = False
+
+        self.handled = 0
+        self.shed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_last = 0.0
+
+        self._task = None
+
+    def post(self, event, **data):
+        '''
+        Queue an event for the app. Returns False if the event was shed
+        because the mailbox is full or the actor is closed.
+        '''
+        if self.closed:
+            return False
+
+        try:
+            self.mailbox.put_nowait((event, data))
+        except asyncio.QueueFull:
+            self.shed += 1
+            return False
+
+        if not self._task:
+            self._task = asyncio.ensure_future(self._run())
+
+        return True
+
+    def close(self):
+        '''
+        Stop the worker once the event being handled (if any) is done.
+        Safe to call from within the app's own `handle`.
+        '''
+        self.closed = True
+
+        if self._task and not self.busy:
+            self._task.cancel()
+
+    async def stop(self, timeout=None):
+        '''
+        Close the actor and wait for the event being handled (if any) to
+        finish, so the app can be ended without a handler running next to
+        it. A handler still running after `timeout` seconds, or when the
+        wait is cancelled, is cancelled. Not for use from within `handle`.
+        '''
+        self.close()
+
+        task = self._task
+        if not task or task.done():
+            return
+
+        try:
+            await asyncio.wait([task], timeout=timeout)
+        finally:
+            if not task.done():
+                task.cancel()
+
+    async def _run(self):
+        while not self.closed:
+            event, data = await self.mailbox.get()
+            self.busy = True
+            start = time.perf_counter()
+
+            try:
+                await self.app.handle(event, **data)
+            except Exception:
+                logger.exception(f'Error handling {event} in {self.app.app_name}')
+            finally:
+                self.busy = False
+                self._record(time.perf_counter() - start)
+
+    def _record(self, elapsed):
+        if self.metrics:
+            self.metrics.observe('handle_seconds', elapsed, game=self.app.app_name)
+
+        self.handled += 1
+        self.latency_last = elapsed
+        self.latency_total += elapsed
+        self.latency_max = max(self.latency_max, elapsed)
+
+    def stats(self):
+        return {
+            'depth': self.mailbox.qsize(),
+            'handled': self.handled,
+            'shed': self.shed,
+            'latency_avg': self.latency_total / self.handled if self.handled else 0.0,
+            'latency_max': self.latency_max,
+            'latency_last': self.latency_last,
+        }
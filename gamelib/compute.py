@@ -0,0 +1,74 @@
+import time
+import asyncio
+import logging
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger('bot')
+
+
+class ComputePool:
+    '''
+    Runs CPU-bound work, like a bot opponent's search, in worker processes
+    so it can't block the event loop or hold the GIL while other sessions
+    wait.
+
+    Workers are started on first use. `fn` and its arguments are pickled,
+    so `fn` has to be a module-level function. Modules stay imported in a
+    worker between calls, so `fn` can keep caches there.
+    '''
+
+    def __init__(self, max_workers=2, metrics=None):
+        self.max_workers = max_workers
+        self.metrics = metrics
+        self._executor = None
+
+        self.running = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.failed = 0
+
+    async def run(self, fn, *args, timeout=None):
+        '''
+        Call `fn(*args)` in a worker. Raises asyncio.TimeoutError after
+        `timeout` seconds, though the worker still finishes the call.
+        '''
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        start = time.perf_counter()
+        self.running += 1
+
+        try:
+            future = asyncio.get_event_loop().run_in_executor(self._executor, fn, *args)
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory), start new ones next time
+            logger.error(f'Compute worker died running {fn.__name__}')
+            self.failed += 1
+            self.shutdown()
+            raise
+        finally:
+            self.running -= 1
+            if self.metrics:
+                self.metrics.observe('compute_seconds', time.perf_counter() - start, fn=fn.__name__)
+
+        self.completed += 1
+        return result
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'completed': self.completed,
+            'timeouts': self.timeouts,
+            'failed': self.failed,
+        }
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+
+from .outbound import CONTROLS, route
+
+logger = logging.getLogger('bot')
+
+
+class ControlInstaller:
+    '''
+    Adds reaction controls to messages.
+
+    Requests go through the outbound scheduler, which throttles them by the
+    channel's reaction route. A message's controls are added one after
+    another, so they always show up in the order they were given; several
+    messages get theirs in parallel.
+    '''
+
+    def __init__(self, outbound):
+        self.outbound = outbound
+        self.playable = dict()
+
+    async def install(self, message, emojis):
+        # Reactions sent together can land out of order
+        for emoji in emojis:
+            await self.outbound.request(CONTROLS, route('reaction', message), message.add_reaction, emoji)
+
+    async def install_many(self, controls):
+        '''
+        Install controls on several messages in parallel.
+        `controls` is a list of (message, emojis) pairs.
+        '''
+        await asyncio.gather(*(self.install(message, emojis) for message, emojis in controls))
+
+    def record_playable(self, app_name, seconds):
+        '''
+        Record the time it took for a game to become playable.
+        '''
+        count, total, worst = self.playable.get(app_name, (0, 0.0, 0.0))
+        self.playable[app_name] = (count + 1, total + seconds, max(worst, seconds))
+
+        logger.info(f'{app_name} playable in {seconds * 1000:.0f}ms')
+
+    def stats(self):
+        return {
+            app_name: {'count': count, 'avg': total / count, 'max': worst}
+            for app_name, (count, total, worst) in self.playable.items()
+        }
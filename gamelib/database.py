@@ -1,16 +1,335 @@
-from tinydb import TinyDB, where
-from tinydb.storages import JSONStorage
-from tinydb.middlewares import CachingMiddleware
+import json
+import time
+import asyncio
+import logging
+import sqlite3
 
-CachingMiddleware.WRITE_CACHE_SIZE = 0
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
-class Database:
-    def __init__(self):
-        self.db = TinyDB('db.json', storage=CachingMiddleware(JSONStorage))
+from .files import atomic_write
+
+logger = logging.getLogger('bot')
+
+
+class Database(metaclass=ABCMeta):
+    '''
+    Storage for player preferences, keyed by player id, and for guild
+    defaults, keyed by guild id.
+    '''
+
+    @abstractmethod
+    def get_player_prefs(self, id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_player_prefs(self, id, data):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_guild_prefs(self, id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_guild_prefs(self, id, data):
+        raise NotImplementedError
+
+    def get_many(self, ids):
+        '''
+        Preferences of several players, as {id: data} for the players found.
+        '''
+        found = ((id, self.get_player_prefs(id)) for id in ids)
+        return {id: data for id, data in found if data is not None}
+
+    def set_many(self, items):
+        '''
+        Write several (id, data) pairs. Backends write them atomically.
+        '''
+        for id, data in items:
+            self.set_player_prefs(id, data)
+
+    def close(self):
+        pass
+
+
+class AtomicJSONStorage:
+    '''
+    TinyDB storage that replaces its file atomically on every write.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+
+        return json.loads(text) if text else None
+
+    def write(self, data):
+        with atomic_write(self.path, encoding='utf-8') as f:
+            json.dump(data, f)
+
+    def close(self):
+        pass
+
+
+class TinyDatabase(Database):
+    '''
+    The original JSON file storage, kept for existing deployments.
+    '''
+
+    def __init__(self, path='db.json'):
+        from tinydb import TinyDB
+        from tinydb.middlewares import CachingMiddleware
+
+        storage = CachingMiddleware(AtomicJSONStorage)
+        # The file is rewritten once per commit, see `set_many`
+        storage.WRITE_CACHE_SIZE = float('inf')
+
+        self.db = TinyDB(path, storage=storage)
         self.players = self.db.table('players')
+        self.guilds = self.db.table('guilds')
 
     def get_player_prefs(self, id):
+        from tinydb import where
         return self.players.get(where('id') == id)
 
+    def get_guild_prefs(self, id):
+        from tinydb import where
+        return self.guilds.get(where('id') == id)
+
+    def set_guild_prefs(self, id, data):
+        from tinydb import where
+        self.guilds.upsert(data, where('id') == id)
+        self.db.storage.flush()
+
+    def get_many(self, ids):
+        from tinydb import where
+        return {doc['id']: doc for doc in self.players.search(where('id').one_of(set(ids)))}
+
+    def set_player_prefs(self, id, data):
+        self.set_many([(id, data)])
+
+    def set_many(self, items):
+        from tinydb import where
+
+        # One pass over the table for updates, then the new players
+        batch = dict(items)
+        updated = set()
+
+        def replace(doc):
+            doc.update(batch[doc['id']])
+            updated.add(doc['id'])
+
+        self.players.update(replace, where('id').one_of(set(batch)))
+        self.players.insert_multiple(data for id, data in batch.items() if id not in updated)
+
+        self.db.storage.flush()
+
+    def close(self):
+        self.db.close()
+
+
+class SQLiteDatabase(Database):
+    '''
+    SQLite storage in WAL mode, with one row of JSON preferences per player.
+    '''
+
+    GET = 'SELECT prefs FROM players WHERE id = ?'
+    SET = 'INSERT OR REPLACE INTO players (id, prefs) VALUES (?, ?)'
+    GET_GUILD = 'SELECT prefs FROM guilds WHERE id = ?'
+    SET_GUILD = 'INSERT OR REPLACE INTO guilds (id, prefs) VALUES (?, ?)'
+
+    def __init__(self, path='db.sqlite3'):
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS players (id INTEGER PRIMARY KEY, prefs TEXT NOT NULL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS guilds (id INTEGER PRIMARY KEY, prefs TEXT NOT NULL)')
+
+    def get_player_prefs(self, id):
+        row = self.conn.execute(self.GET, (id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, ids):
+        ids = list(ids)
+        query = f"SELECT id, prefs FROM players WHERE id IN ({','.join('?' * len(ids))})"
+        return {id: json.loads(prefs) for id, prefs in self.conn.execute(query, ids)} if ids else {}
+
     def set_player_prefs(self, id, data):
-        self.players.upsert(data, where('id') == id)
+        self.conn.execute(self.SET, (id, json.dumps(data, separators=(',', ':'))))
+
+    def get_guild_prefs(self, id):
+        row = self.conn.execute(self.GET_GUILD, (id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_guild_prefs(self, id, data):
+        self.conn.execute(self.SET_GUILD, (id, json.dumps(data, separators=(',', ':'))))
+
+    def set_many(self, items):
+        rows = [(id, json.dumps(data, separators=(',', ':'))) for id, data in items]
+
+        self.conn.execute('BEGIN')
+        try:
+            self.conn.executemany(self.SET, rows)
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def close(self):
+        self.conn.close()
+
+
+class AsyncDatabase:
+    '''
+    Runs a Database on one dedicated thread, so that disk I/O never blocks
+    the event loop and the backend is only ever used from a single thread.
+    '''
+
+    def __init__(self, backend: Database, metrics=None):
+        self.backend = backend
+        self.metrics = metrics
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='database')
+
+    async def run(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_event_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self._record(fn, start)
+
+    def _record(self, fn, start):
+        if self.metrics:
+            self.metrics.observe('db_seconds', time.perf_counter() - start, op=fn.__name__)
+
+    async def get_player_prefs(self, id):
+        return await self.run(self.backend.get_player_prefs, id)
+
+    async def set_player_prefs(self, id, data):
+        return await self.run(self.backend.set_player_prefs, id, data)
+
+    async def get_guild_prefs(self, id):
+        return await self.run(self.backend.get_guild_prefs, id)
+
+    async def set_guild_prefs(self, id, data):
+        return await self.run(self.backend.set_guild_prefs, id, data)
+
+    async def get_many(self, ids):
+        return await self.run(self.backend.get_many, ids)
+
+    async def set_many(self, items):
+        return await self.run(self.backend.set_many, items)
+
+    def close(self):
+        self.executor.submit(self.backend.close)
+        self.executor.shutdown(wait=True)
+
+
+class WriteBehind:
+    '''
+    Buffers preference writes and commits them in batches.
+
+    Pending writes for the same player are merged, so only the latest data
+    is written. A batch is committed atomically once it holds `max_batch`
+    players, `max_delay` seconds after its first write, or on `flush`.
+    `max_delay` is the longest window of writes that can be lost in a crash.
+    '''
+
+    MAX_BATCH = 500
+    MAX_DELAY = 2.0
+
+    def __init__(self, db: AsyncDatabase, timers, max_batch=None, max_delay=None):
+        self.db = db
+        self.timers = timers
+        self.max_batch = max_batch or self.MAX_BATCH
+        self.max_delay = max_delay or self.MAX_DELAY
+
+        self._pending = dict()
+        self._writing = dict()
+        self.merged = 0
+        self.batches = 0
+        self.written = 0
+
+    def get(self, id):
+        '''
+        Data waiting to be written for player `id`, or None.
+        '''
+        data = self._pending.get(id)
+        return data if data is not None else self._writing.get(id)
+
+    def set(self, id, data):
+        if id in self._pending:
+            self.merged += 1
+        elif not self._pending:
+            self.timers.schedule('write-behind', self.max_delay, self.flush)
+
+        self._pending[id] = data
+
+        if len(self._pending) >= self.max_batch:
+            asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        self.timers.cancel('write-behind')
+
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, dict()
+        self._writing.update(batch)
+
+        try:
+            await self.db.set_many(list(batch.items()))
+            failed = False
+        except Exception:
+            logger.exception(f'Failed to write {len(batch)} players, retrying')
+            failed = True
+
+        for id, data in batch.items():
+            # A newer write for the player is in flight or already committed
+            if self._writing.get(id) is not data:
+                continue
+
+            del self._writing[id]
+            # Retry, unless a newer write is waiting anyway
+            if failed:
+                self._pending.setdefault(id, data)
+
+        if failed:
+            self.timers.schedule('write-behind', self.max_delay, self.flush)
+            return
+
+        self.batches += 1
+        self.written += len(batch)
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'merged': self.merged,
+            'batches': self.batches,
+            'written': self.written,
+        }
+
+
+BACKENDS = {
+    'tinydb': TinyDatabase,
+    'sqlite': SQLiteDatabase,
+}
+
+
+def open_database(config):
+    '''
+    Open the database described by `config`, given as 'backend:path'
+    (e.g. 'sqlite:db.sqlite3'). The path may be left out to use the
+    backend's default.
+    '''
+    backend, _, path = config.partition(':')
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown database backend '{backend}', use one of {', '.join(BACKENDS)}")
+
+    return BACKENDS[backend](path) if path else BACKENDS[backend]()
@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode='w', fsync=True, **kwargs):
+    '''
+    Open a temporary file next to `path` to write to, and move it over
+    `path` once the block is done, so readers see either the old file or
+    the whole new one. With `fsync`, the data is on disk before the move.
+    Nothing is replaced if the block raises.
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}-')
+
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
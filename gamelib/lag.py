@@ -0,0 +1,51 @@
+import asyncio
+
+
+class LoopLagMonitor:
+    '''
+    Measures how late the event loop wakes up from a short sleep, which is
+    how long something blocked the loop.
+    '''
+
+    INTERVAL = 0.1
+
+    def __init__(self, interval=None):
+        self.interval = interval or self.INTERVAL
+        self._task = None
+        self.reset()
+
+    def reset(self):
+        self.samples = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self._record(max(0.0, loop.time() - start - self.interval))
+
+    def _record(self, lag):
+        self.samples += 1
+        self.total += lag
+        self.last = lag
+        self.max = max(self.max, lag)
+
+    def stats(self):
+        return {
+            'avg': self.total / self.samples if self.samples else 0.0,
+            'max': self.max,
+            'last': self.last,
+        }
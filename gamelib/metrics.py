@@ -0,0 +1,210 @@
+import asyncio
+import logging
+
+from bisect import bisect_left
+
+from .files import atomic_write
+
+logger = logging.getLogger('bot')
+
+
+class Histogram:
+    '''
+    Counts of observed durations in fixed buckets, Prometheus style.
+
+    Everything is recorded from the event loop, so `observe` is a bisect
+    and a few additions with no locking.
+    '''
+
+    # Upper bounds in seconds, the last bucket is +Inf
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets or self.BUCKETS
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        '''
+        Estimate a quantile by interpolating within its bucket.
+        '''
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+
+        return self.buckets[-1]
+
+
+class Metrics:
+    '''
+    Latency histograms and gauges, exported as Prometheus text.
+
+    Histograms are keyed by name and labels, e.g.
+    `metrics.histogram('api_seconds', route='edit').observe(0.12)`. Gauges
+    are collected when exported, from callbacks returning either a number
+    or a dict of numbers, e.g. one of the components' `stats()`.
+    '''
+
+    PREFIX = 'gamebot_'
+
+    def __init__(self):
+        self._histograms = dict()
+        self._collectors = dict()
+        self._server = None
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+
+        return histogram
+
+    def observe(self, name, seconds, **labels):
+        self.histogram(name, **labels).observe(seconds)
+
+    def histograms(self, name):
+        '''
+        {labels: histogram} for every histogram named `name`.
+        '''
+        return {labels: histogram for (key, labels), histogram in self._histograms.items() if key == name}
+
+    def collect(self, name, fn, label=None):
+        '''
+        Export `fn()` as gauges named `name`. If it returns a dict, each
+        item becomes a gauge: `name_key`, or with `label`, `name{label=key}`.
+        Items that are dicts themselves become `name_field{label=key}`.
+        '''
+        self._collectors[name] = (fn, label)
+
+    def gauges(self):
+        '''
+        [(name, labels, value)] for every collected gauge.
+        '''
+        gauges = []
+
+        for name, (fn, label) in self._collectors.items():
+            try:
+                values = fn()
+            except Exception:
+                logger.exception(f'Failed to collect {name} metrics')
+                continue
+
+            if not isinstance(values, dict):
+                gauges.append((name, (), values))
+                continue
+
+            for key, value in values.items():
+                # Nested dicts, like per-priority stats, are labelled by their key
+                if isinstance(value, dict):
+                    for field, number in value.items():
+                        if self._is_number(number):
+                            gauges.append((f'{name}_{field}', ((label or 'key', key),), number))
+                elif not self._is_number(value):
+                    continue
+                elif label:
+                    gauges.append((name, ((label, key),), value))
+                else:
+                    gauges.append((f'{name}_{key}', (), value))
+
+        return gauges
+
+    def render(self):
+        '''
+        All metrics in the Prometheus text exposition format.
+        '''
+        lines = []
+        typed = set()
+
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            name = self.PREFIX + name
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} histogram')
+
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{self._labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f'{name}_sum{self._labels(labels)} {histogram.sum}')
+            lines.append(f'{name}_count{self._labels(labels)} {histogram.count}')
+
+        # Every sample of a metric has to be in one group
+        gauges = dict()
+        for name, labels, value in self.gauges():
+            gauges.setdefault(self.PREFIX + name, []).append((labels, value))
+
+        for name, samples in gauges.items():
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                lines.append(f'{name}{self._labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        '''
+        Atomically write the metrics to `path`, e.g. for node_exporter's
+        textfile collector.
+        '''
+        with atomic_write(path, fsync=False) as f:
+            f.write(self.render())
+
+    async def serve(self, host='127.0.0.1', port=9108):
+        '''
+        Serve the metrics over HTTP, for Prometheus to scrape.
+        '''
+        if self._server:
+            return
+
+        async def respond(reader, writer):
+            try:
+                await reader.readuntil(b'\r\n\r\n')
+                body = self.render().encode()
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\n'
+                    b'Content-Type: text/plain; version=0.0.4\r\n'
+                    b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+                    b'Connection: close\r\n\r\n' + body
+                )
+                await writer.drain()
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        self._server = await asyncio.start_server(respond, host, port)
+        logger.info(f'Serving metrics on http://{host}:{port}/metrics')
+
+    def stop(self):
+        if self._server:
+            self._server.close()
+            self._server = None
+
+    @staticmethod
+    def _is_number(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ''
+
+        return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
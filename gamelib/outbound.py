@@ -0,0 +1,330 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from .ratelimit import TokenBucket
+
+logger = logging.getLogger('bot')
+
+# Priority classes, most important first
+RENDER = 0
+CONTROLS = 1
+REMOVAL = 2
+NOTIFY = 3
+CLEANUP = 4
+
+PRIORITY_NAMES = {
+    RENDER: 'render',
+    CONTROLS: 'controls',
+    REMOVAL: 'removal',
+    NOTIFY: 'notify',
+    CLEANUP: 'cleanup',
+}
+
+
+class Dropped(Exception):
+    '''
+    Raised for a request that missed its deadline before it could be sent.
+    '''
+
+
+class _Request:
+    __slots__ = ('priority', 'route', 'fn', 'args', 'kwargs', 'deadline', 'queued', 'future')
+
+    def __init__(self, priority, route, fn, args, kwargs, deadline):
+        self.priority = priority
+        self.route = route
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.queued = time.monotonic()
+        self.future = asyncio.get_event_loop().create_future()
+
+
+class OutboundScheduler:
+    '''
+    Central queue for outbound Discord requests.
+
+    Requests are started in priority order, each route is throttled by its own
+    token bucket, and low priority requests that wait past their deadline are
+    dropped instead of being sent late. A request blocked on its route never
+    holds up requests for other routes.
+
+    Each route has its own queue, in priority order and then in the order
+    requests came in. Routes whose first request can go out are kept in a
+    heap by that request's priority, and routes waiting for their bucket in
+    a heap by when it has a token again. Queued requests are only looked at
+    when they come first on a route that can send, so a backlog on one route
+    costs nothing while it waits.
+    '''
+
+    # (rate per second, burst) per route kind; routes are (kind, channel id)
+    LIMITS = {
+        'edit': (5, 5),
+        'send': (5, 5),
+        'delete': (5, 5),
+        'reaction': (4, 1),
+    }
+    DEFAULT_LIMIT = (5, 5)
+    # Seconds between dropping the buckets of routes that have gone quiet
+    BUCKET_SWEEP = 60.0
+
+    # Requests in flight at once, across all routes
+    CONCURRENCY = 8
+
+    # Default time a request may wait in the queue, per priority. A player's
+    # reaction that is never removed leaves its button dead for them, so
+    # removals wait however long it takes.
+    DEADLINES = {
+        RENDER: None,
+        CONTROLS: None,
+        REMOVAL: None,
+        NOTIFY: 30.0,
+        CLEANUP: 60.0,
+    }
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        # {route: heap of (priority, seq, request)}
+        self._routes = dict()
+        # Heap of (priority, seq, route) for each route's first request,
+        # only valid while `_heads[route]` is still that seq
+        self._ready = []
+        self._heads = dict()
+        # Heap of (time, seq, route) for routes waiting on their bucket
+        self._timers = []
+        self._waiting = set()
+        self._queued = 0
+        self._buckets = dict()
+        self._next_sweep = time.monotonic() + self.BUCKET_SWEEP
+        self._counter = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self._running = 0
+        self._inflight = set()
+
+        self.sent = {priority: 0 for priority in PRIORITY_NAMES}
+        self.dropped = {priority: 0 for priority in PRIORITY_NAMES}
+        self.wait_total = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self.wait_max = {priority: 0.0 for priority in PRIORITY_NAMES}
+
+    def submit(self, priority, route, fn, *args, deadline=None, **kwargs):
+        '''
+        Queue `fn(*args, **kwargs)` and return a future for its result.
+        `deadline` is the number of seconds the request may wait before it
+        is dropped, defaulting to the priority's deadline.
+        '''
+        if deadline is None:
+            deadline = self.DEADLINES.get(priority)
+
+        request = _Request(
+            priority, route, fn, args, kwargs,
+            time.monotonic() + deadline if deadline is not None else None
+        )
+        entry = (priority, next(self._counter), request)
+
+        queue = self._routes.setdefault(route, [])
+        heapq.heappush(queue, entry)
+        self._queued += 1
+
+        if queue[0] is entry:
+            self._ready_route(route)
+        self._wake()
+
+        return request.future
+
+    async def request(self, priority, route, fn, *args, deadline=None, **kwargs):
+        '''
+        Like `submit`, but waits for the result.
+        '''
+        return await self.submit(priority, route, fn, *args, deadline=deadline, **kwargs)
+
+    def pending(self):
+        return self._queued
+
+    async def drain(self, timeout=None):
+        '''
+        Wait until every queued request has been sent or dropped and the
+        ones in flight are done, or until `timeout` seconds have passed.
+        '''
+        futures = [entry[2].future for queue in self._routes.values() for entry in queue]
+        futures.extend(self._inflight)
+
+        if futures:
+            await asyncio.wait(futures, timeout=timeout)
+
+    def stop(self):
+        '''
+        Stop sending. Requests still queued fail with Dropped.
+        '''
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+        lost = 0
+        for queue in self._routes.values():
+            for _, _, request in queue:
+                if not request.future.done():
+                    lost += 1
+                    request.future.set_exception(Dropped(request.route))
+                    request.future.exception()
+
+        if lost:
+            logger.warning(f'Dropped {lost} outbound requests on shutdown')
+
+        self._routes.clear()
+        self._ready.clear()
+        self._heads.clear()
+        self._timers.clear()
+        self._waiting.clear()
+        self._queued = 0
+
+    def stats(self):
+        return {
+            name: {
+                'sent': self.sent[priority],
+                'dropped': self.dropped[priority],
+                'wait_avg': self.wait_total[priority] / self.sent[priority] if self.sent[priority] else 0.0,
+                'wait_max': self.wait_max[priority],
+            }
+            for priority, name in PRIORITY_NAMES.items()
+        }
+
+    def bucket(self, route):
+        if route not in self._buckets:
+            kind = route[0] if isinstance(route, tuple) else route
+            rate, burst = self.LIMITS.get(kind, self.DEFAULT_LIMIT)
+            self._buckets[route] = TokenBucket(rate, burst)
+        return self._buckets[route]
+
+    def _sweep(self, now):
+        '''
+        Forget buckets that have refilled, a new one would be the same.
+        '''
+        self._next_sweep = now + self.BUCKET_SWEEP
+        for route in [route for route, bucket in self._buckets.items() if bucket.is_full()]:
+            del self._buckets[route]
+
+    def _ready_route(self, route):
+        '''
+        Line up the route's first request, unless the route is waiting on
+        its bucket.
+        '''
+        queue = self._routes.get(route)
+        if not queue:
+            self._routes.pop(route, None)
+            return
+
+        if route in self._waiting:
+            return
+
+        priority, seq, _ = queue[0]
+        if self._heads.get(route) != seq:
+            self._heads[route] = seq
+            heapq.heappush(self._ready, (priority, seq, route))
+
+    def _wake(self):
+        if not self._wakeup:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+
+        if not self._task:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._dispatch()
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self):
+        '''
+        Start every request that can go out now, in priority order.
+        Returns how long to sleep before trying again (None to wait for work).
+        '''
+        now = time.monotonic()
+
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        while self._timers and self._timers[0][0] <= now:
+            route = heapq.heappop(self._timers)[2]
+            self._waiting.discard(route)
+            self._ready_route(route)
+
+        while self._ready and self._running < self.CONCURRENCY:
+            _, seq, route = heapq.heappop(self._ready)
+
+            # The route has a newer first request, with its own entry
+            if self._heads.get(route) != seq:
+                continue
+            del self._heads[route]
+
+            queue = self._routes[route]
+            entry = heapq.heappop(queue)
+            request = entry[2]
+
+            if request.future.done():
+                self._queued -= 1
+            elif request.deadline is not None and now > request.deadline:
+                self._queued -= 1
+                self.dropped[request.priority] += 1
+                request.future.set_exception(Dropped(request.route))
+                # Nobody may be waiting on a dropped request
+                request.future.exception()
+            elif self.bucket(route).try_acquire():
+                self._queued -= 1
+                self._start(request, now)
+            else:
+                # Keep requests on the same route in order, until the bucket refills
+                heapq.heappush(queue, entry)
+                self._waiting.add(route)
+                heapq.heappush(self._timers, (now + self.bucket(route).delay(), next(self._counter), route))
+                continue
+
+            self._ready_route(route)
+
+        return max(0.0, self._timers[0][0] - now) if self._timers else None
+
+    def _start(self, request, now):
+        waited = now - request.queued
+        self.sent[request.priority] += 1
+        self.wait_total[request.priority] += waited
+        self.wait_max[request.priority] = max(self.wait_max[request.priority], waited)
+
+        self._running += 1
+        self._inflight.add(request.future)
+        asyncio.ensure_future(self._send(request))
+
+    async def _send(self, request):
+        start = time.perf_counter()
+        try:
+            result = await request.fn(*request.args, **request.kwargs)
+            if not request.future.done():
+                request.future.set_result(result)
+        except Exception as err:
+            if not request.future.done():
+                request.future.set_exception(err)
+        finally:
+            self._running -= 1
+            self._inflight.discard(request.future)
+            if self._task:
+                self._wake()
+            if self.metrics:
+                kind = request.route[0] if isinstance(request.route, tuple) else request.route
+                self.metrics.observe('api_seconds', time.perf_counter() - start, route=kind)
+
+
+def route(kind, message_or_channel):
+    '''
+    Rate limit route for a message or channel: Discord buckets these per channel.
+    '''
+    channel = getattr(message_or_channel, 'channel', message_or_channel)
+    return (kind, channel.id)
@@ -1,40 +1,433 @@
-from collections import defaultdict
+import re
+import asyncio
+import logging
+
+from types import MappingProxyType
+
+from .cache import LRUCache
+from .database import AsyncDatabase, WriteBehind
+
+logger = logging.getLogger('bot')
+
+
+class PreferenceError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+class Preference:
+    '''
+    A customizable setting. `parse` validates what a player typed in `g!set`
+    and converts it to the stored value, which is what games read back.
+    '''
+
+    def __init__(self, description: str, default=None):
+        self.description = description
+        self.default = default
+
+    def parse(self, text: str):
+        return text
+
+    def load(self, value):
+        '''
+        Turn a stored value into the typed value, e.g. for data saved before
+        the setting was typed. Invalid values fall back to the default.
+        '''
+        return value
+
+    def format(self, value):
+        return str(value)
+
+
+class Color(Preference):
+    '''
+    A color, stored as a 0xRRGGBB int that can be passed to embeds as is.
+    Accepts '#ffaf2c', '255,175,44' or a discord color name such as 'teal'.
+    '''
+
+    def parse(self, text):
+        text = text.strip().lower()
+
+        hex_match = re.fullmatch(r'(?:#|0x)?([0-9a-f]{6})', text)
+        if hex_match:
+            return int(hex_match.group(1), 16)
+
+        parts = re.split(r'[\s,]+', text.strip('()'))
+        if len(parts) == 3 and all(part.isdigit() for part in parts):
+            r, g, b = map(int, parts)
+            if max(r, g, b) > 255:
+                raise PreferenceError('Color values go from 0 to 255')
+            return (r << 16) + (g << 8) + b
+
+        # Named colors are the classmethods of discord.Color, like Color.teal()
+        import discord
+        name = text.replace(' ', '_')
+        try:
+            color = getattr(discord.Color, name)() if not name.startswith('_') else None
+        except (AttributeError, TypeError):
+            color = None
+
+        if isinstance(color, discord.Color):
+            return color.value
+
+        raise PreferenceError('Colors look like `#ffaf2c`, `255,175,44` or `teal`')
+
+    def load(self, value):
+        if isinstance(value, int) or value is None:
+            return value
+
+        try:
+            return self.parse(str(value))
+        except PreferenceError:
+            return self.default
+
+    def format(self, value):
+        return f'#{value:06x}'
+
+
+class Emoji(Preference):
+    '''
+    A unicode emoji or a custom server emoji.
+    '''
+
+    CUSTOM = re.compile(r'<a?:\w+:\d+>')
+
+    def parse(self, text):
+        import emoji
+
+        text = text.strip()
+        if text in emoji.UNICODE_EMOJI or self.CUSTOM.fullmatch(text):
+            return text
+
+        raise PreferenceError('That isn\'t an emoji!')
+
+
+class Int(Preference):
+    def __init__(self, description: str, default=None, min=None, max=None):
+        super().__init__(description, default)
+        self.min = min
+        self.max = max
+
+    def parse(self, text):
+        try:
+            value = int(text)
+        except ValueError:
+            raise PreferenceError('That should be a whole number')
+
+        if (self.min is not None and value < self.min) or (self.max is not None and value > self.max):
+            raise PreferenceError(f'That should be between {self.min} and {self.max}')
+
+        return value
+
+    def load(self, value):
+        if isinstance(value, int) or value is None:
+            return value
+
+        try:
+            return self.parse(str(value))
+        except PreferenceError:
+            return self.default
+
+
+class Enum(Preference):
+    def __init__(self, description: str, choices, default=None):
+        super().__init__(description, default)
+        self.choices = list(choices)
+
+    def parse(self, text):
+        text = text.strip().lower()
+        if text not in self.choices:
+            raise PreferenceError(f"Pick one of {', '.join(self.choices)}")
+
+        return text
+
+    def load(self, value):
+        return value if value in self.choices or value is None else self.default
+
+
+GLOBAL = 'global'
+
+
+class PreferenceView:
+    '''
+    A session's read-only copy of its players' preferences for one app.
+
+    Every player's settings are resolved ahead of time into one flat dict,
+    so a lookup is a single dict hit however many layers there are. A
+    player's dict is only rebuilt when `push` hands the view their updated
+    preferences, and all of them when the guild's defaults change.
+    '''
+
+    def __init__(self, preferences, app: str, prefs, guild_prefs=None):
+        self._preferences = preferences
+        self._app = app
+        self._prefs = dict(prefs)
+        self._guild = guild_prefs or {}
+        self._defaults = preferences.defaults(app)
+        self._effective = {id: self._resolve(data) for id, data in self._prefs.items()}
+
+    def get(self, player, key, default=None):
+        value = self._effective[player.id].get(key) if player.id in self._effective else None
+        if value is not None:
+            return value
+
+        return default if default is not None else self._defaults.get(key)
+
+    def push(self, player, prefs):
+        if player.id in self._prefs:
+            self._prefs[player.id] = prefs
+            self._effective[player.id] = self._resolve(prefs)
+
+    def push_guild(self, guild_prefs):
+        self._guild = guild_prefs
+        self._effective = {id: self._resolve(data) for id, data in self._prefs.items()}
+
+    def _resolve(self, prefs):
+        return MappingProxyType(self._preferences.resolve(self._app, prefs, self._guild))
 
-from .database import Database
 
 class Preferences:
-    def __init__(self, db: Database):
+    '''
+    Player preferences, and guild defaults for them.
+
+    A setting resolves, in order, to the player's value for the app, the
+    player's global value, the guild's default for the app, the guild's
+    global default, and finally the declared default.
+    '''
+
+    # Players whose preferences are kept in memory, and for how long (None is forever)
+    CACHE_SIZE = 10000
+    CACHE_TTL = None
+
+    def __init__(self, db: AsyncDatabase, writer: WriteBehind, cache_size=None, cache_ttl=None):
         self.db = db
+        self.writer = writer
         self.available = {}
+        self.cache = LRUCache(cache_size or self.CACHE_SIZE, cache_ttl or self.CACHE_TTL)
+        self.guilds = LRUCache(cache_size or self.CACHE_SIZE, cache_ttl or self.CACHE_TTL)
+        # {player id: {(app, guild id): resolved settings}}, see `effective`
+        self.resolved = LRUCache(cache_size or self.CACHE_SIZE)
+        self._loading = dict()
 
-    def get(self, player, app, key):
-        prefs = self.get_all(player)
+    def get(self, player, app, key, default=None, guild=None):
+        '''
+        Lookup for code that can't await, which never touches storage. If
+        the player or guild isn't cached, they are loaded in the background
+        and the defaults are used meanwhile.
+        '''
+        prefs = self.cache.get(player.id)
+        if prefs is None:
+            prefs = self.writer.get(player.id)
+        if prefs is None:
+            self._preload(('player', player.id), self.aget_all(player))
 
-        if app in prefs and key in prefs[app]:
-            return prefs[app][key]
+        guild_prefs = self.guilds.get(guild.id) if guild is not None else {}
+        if guild_prefs is None:
+            self._preload(('guild', guild.id), self.aget_guild(guild))
 
-        return None
+        # Only cache what was resolved from fully loaded layers
+        if prefs is None or guild_prefs is None:
+            resolved = self.resolve(app, prefs or {}, guild_prefs or {})
+        else:
+            resolved = self.effective(player, app, guild, prefs, guild_prefs)
 
-    def get_all(self, player):
-        return self.db.get_player_prefs(player.id) or {}
+        return self._lookup(resolved, app, key, default)
 
-    def get_all_for_app(self, player, app):
-        return self.get_all(player.id).get(app) or {}
+    async def aget(self, player, app, key, default=None, guild=None):
+        resolved = self.effective(player, app, guild, await self.aget_all(player), await self.aget_guild(guild))
+        return self._lookup(resolved, app, key, default)
 
-    def set(self, player, app: str, key: str, value: str):
-        if not self.exists(app, key):
-            raise KeyError
+    def effective(self, player, app, guild, prefs, guild_prefs):
+        '''
+        `resolve` for the player's `prefs` and the guild's `guild_prefs`,
+        cached until either of them changes.
+        '''
+        by_app = self.resolved.get(player.id)
+        if by_app is None:
+            by_app = dict()
+            self.resolved.set(player.id, by_app)
+
+        key = (app, guild.id if guild is not None else None)
+        resolved = by_app.get(key)
+        if resolved is None:
+            resolved = by_app[key] = self.resolve(app, prefs, guild_prefs)
+
+        return resolved
+
+    async def aget_all(self, player):
+        prefs = self.cache.get(player.id)
+
+        if prefs is None:
+            prefs = self.writer.get(player.id) or self._load(await self.db.get_player_prefs(player.id))
+            self.cache.set(player.id, prefs)
+
+        return prefs
+
+    async def aget_many(self, players):
+        '''
+        Preferences of several players, with one storage query for all the
+        players that are not cached. Returns {player id: prefs}.
+        '''
+        found = dict()
+        missing = []
+
+        for player in players:
+            prefs = self.cache.get(player.id)
+            if prefs is None:
+                prefs = self.writer.get(player.id)
+            if prefs is None:
+                missing.append(player.id)
+            else:
+                found[player.id] = prefs
+
+        if missing:
+            stored = await self.db.get_many(missing)
+            for id in missing:
+                found[id] = self._load(stored.get(id))
+                self.cache.set(id, found[id])
+
+        return found
+
+    async def aget_guild(self, guild):
+        if guild is None:
+            return {}
+
+        prefs = self.guilds.get(guild.id)
+        if prefs is None:
+            prefs = self._load(await self.db.get_guild_prefs(guild.id))
+            self.guilds.set(guild.id, prefs)
+
+        return prefs
+
+    async def view(self, app: str, players, guild=None):
+        prefs = await self.aget_many(players)
+        return PreferenceView(self, app, prefs, await self.aget_guild(guild))
 
-        prefs = self.db.get_player_prefs(player.id) or {'id': player.id}
-        prefs = defaultdict(dict, prefs)
-        prefs[app][key] = value
-        self.db.set_player_prefs(player.id, dict(prefs))
+    async def aget_all_for_app(self, player, app):
+        return (await self.aget_all(player)).get(app) or {}
+
+    async def aset(self, player, app: str, key: str, value):
+        prefs = self._updated(await self.aget_all(player), player, app, key, value)
+        self.writer.set(player.id, prefs)
+        self.cache.set(player.id, prefs)
+        self.resolved.invalidate(player.id)
+        return prefs
+
+    async def aset_guild(self, guild, app: str, key: str, value):
+        '''
+        Set (or with None, clear) a guild's default. Guild defaults change
+        rarely, so they are written straight away.
+        '''
+        prefs = self._updated(await self.aget_guild(guild), guild, app, key, value)
+        await self.db.set_guild_prefs(guild.id, prefs)
+        self.guilds.set(guild.id, prefs)
+        # Every player's settings in the guild may have changed, and it's rare
+        self.resolved.clear()
+        return prefs
 
     def exists(self, app: str, key: str):
         return app in self.available and key in self.available[app]
 
     def register(self, app, settings):
-        self.available[app] = settings
+        # Plain descriptions are settings without a type
+        self.available[app] = {
+            key: setting if isinstance(setting, Preference) else Preference(setting)
+            for key, setting in settings.items()
+        }
+        # The defaults changed
+        self.resolved.clear()
+
+    def parse(self, app: str, key: str, text: str):
+        '''
+        Validate and convert a value typed by a player. Raises PreferenceError.
+        '''
+        return self.available[app][key].parse(text)
+
+    def format(self, app: str, key: str, value):
+        setting = self.available.get(app, {}).get(key)
+        return setting.format(value) if setting and value is not None else str(value)
+
+    def settings(self, app):
+        '''
+        Settings an app can read: its own and the global ones.
+        '''
+        return {**self.available.get(GLOBAL, {}), **self.available.get(app, {})}
+
+    def defaults(self, app):
+        return {key: setting.default for key, setting in self.settings(app).items() if setting.default is not None}
+
+    def resolve(self, app, prefs, guild_prefs):
+        '''
+        Flatten the layers into {key: value} for every setting of `app`.
+        Keys that no layer sets are None.
+        '''
+        layers = [
+            layer[name] for layer, name in ((prefs, app), (prefs, GLOBAL), (guild_prefs, app), (guild_prefs, GLOBAL))
+            if isinstance(layer.get(name), dict)
+        ]
+
+        resolved = dict()
+        for key in self.settings(app):
+            resolved[key] = next((layer[key] for layer in layers if layer.get(key) is not None), None)
+
+        return resolved
+
+    def _preload(self, key, coro):
+        '''
+        Run a background load, unless the same one is already running.
+        '''
+        if key in self._loading:
+            coro.close()
+            return
+
+        def done(task):
+            self._loading.pop(key, None)
+            if not task.cancelled() and task.exception():
+                logger.error(f'Failed to load {key[0]} {key[1]} preferences: {task.exception()!r}')
+
+        self._loading[key] = asyncio.ensure_future(coro)
+        self._loading[key].add_done_callback(done)
+
+    def _lookup(self, resolved, app, key, default=None):
+        value = resolved.get(key)
+        if value is not None:
+            return value
+
+        if default is not None:
+            return default
+
+        setting = self.settings(app).get(key)
+        return setting.default if setting else None
+
+    def _load(self, prefs):
+        '''
+        Convert stored data to typed values, once, before it is cached.
+        '''
+        if not prefs:
+            return {}
+
+        loaded = dict(prefs)
+        for app, settings in prefs.items():
+            declared = self.available.get(app)
+            if declared and isinstance(settings, dict):
+                loaded[app] = {
+                    key: declared[key].load(value) if key in declared else value
+                    for key, value in settings.items()
+                }
+
+        return loaded
+
+    def _updated(self, prefs, owner, app, key, value):
+        if not self.exists(app, key):
+            raise KeyError
+
+        prefs = {name: dict(settings) if isinstance(settings, dict) else settings for name, settings in prefs.items()}
+        prefs['id'] = owner.id
+
+        if value is None:
+            prefs.get(app, {}).pop(key, None)
+        else:
+            prefs.setdefault(app, {})[key] = value
 
-    def app(self, app):
-        return lambda player, key: self.get(player, app, key)
+        return prefs
@@ -0,0 +1,138 @@
+import os
+import time
+import asyncio
+import cProfile
+import functools
+import pstats
+
+
+class _Profiled:
+    '''
+    Awaitable running a coroutine with the profiler enabled only while one
+    of its steps runs, so time spent suspended (and other sessions' code
+    running meanwhile) isn't profiled.
+    '''
+
+    __slots__ = ('coro', 'profile')
+
+    def __init__(self, coro, profile):
+        self.coro = coro
+        self.profile = profile
+
+    def __await__(self):
+        value, error = None, None
+
+        while True:
+            self.profile.enable()
+            try:
+                if error is not None:
+                    step = self.coro.throw(error)
+                else:
+                    step = self.coro.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.profile.disable()
+
+            try:
+                value, error = (yield step), None
+            except BaseException as err:
+                value, error = None, err
+
+
+class _Run:
+    __slots__ = ('name', 'profile', 'steps')
+
+    def __init__(self, name):
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.steps = 0
+
+
+class Profiler:
+    '''
+    Profiles the `begin` and `handle` calls of a game, or of some sessions,
+    for a while. When nothing is being profiled, `wrap` is a dict check.
+    '''
+
+    # Functions listed in the summary
+    TOP = 15
+
+    def __init__(self, directory='profiles'):
+        self.directory = directory
+        self._games = dict()
+        self._sessions = dict()
+
+    def __bool__(self):
+        return bool(self._games or self._sessions)
+
+    def wrap(self, app, coro):
+        run = self._sessions.get(app) or self._games.get(app.app_name)
+        if not run:
+            return coro
+
+        run.steps += 1
+        return _Profiled(coro, run.profile)
+
+    async def profile(self, seconds, game=None, sessions=()):
+        '''
+        Profile every session of `game`, or the given sessions, for
+        `seconds`. Returns the path of the pstats file and a summary.
+        '''
+        name = game or '-'.join(sorted({app.app_name for app in sessions}))
+        run = _Run(name)
+
+        if game:
+            if game in self._games:
+                raise RuntimeError(f'{game} is already being profiled')
+            self._games[game] = run
+        else:
+            if any(app in self._sessions for app in sessions):
+                raise RuntimeError('That session is already being profiled')
+            for app in sessions:
+                self._sessions[app] = run
+
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            if game:
+                self._games.pop(game, None)
+            for app in sessions:
+                self._sessions.pop(app, None)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.pstats")
+        run.profile.dump_stats(path)
+
+        return path, self.summary(run)
+
+    def summary(self, run, top=None):
+        '''
+        The functions with the most time spent in them.
+        '''
+        top = top or self.TOP
+
+        stats = pstats.Stats(run.profile).stats
+        if not stats:
+            return f'No calls recorded for {run.name}'
+
+        total = sum(tottime for _, _, tottime, _, _ in stats.values())
+        rows = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+
+        lines = [f'{run.name}: {run.steps} calls, {total * 1000:.1f}ms profiled', f"{'calls':>7}{'own ms':>9}{'cum ms':>9}  function"]
+        for (filename, line, function), (_, calls, tottime, cumtime, _) in rows:
+            where = f'{os.path.basename(filename)}:{line}({function})' if line else function
+            lines.append(f'{calls:>7}{tottime * 1000:>9.1f}{cumtime * 1000:>9.1f}  {where}')
+
+        return '\n'.join(lines)
+
+
+def profiled(profiler, fn):
+    '''
+    Wrap an app's coroutine method so `profiler` can profile its calls.
+    '''
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        coro = fn(self, *args, **kwargs)
+        return profiler.wrap(self, coro) if profiler else coro
+    return wrapper
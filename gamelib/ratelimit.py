@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    '''
+    Allows `rate` operations per second with bursts of up to `capacity`.
+    Waiters are served in the order they called `acquire`.
+    '''
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        '''
+        Seconds until a token is available.
+        '''
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def is_full(self):
+        '''
+        Whether the bucket has refilled completely, so it's no different from
+        a new one.
+        '''
+        self._refill()
+        return self.tokens >= self.capacity
+
+    def try_acquire(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        if not self._lock:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while not self.try_acquire():
+                await asyncio.sleep(self.delay())
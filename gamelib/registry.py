@@ -1,14 +1,105 @@
+import time
+import asyncio
+import logging
+import importlib
+
+logger = logging.getLogger('bot')
+
+
+class Manifest:
+    __slots__ = ('name', 'module', 'min_players', 'max_players')
+
+    def __init__(self, name, module, min_players=1, max_players=None):
+        self.name = name
+        self.module = module
+        self.min_players = min_players
+        self.max_players = max_players
+
+
 class Registry:
+    '''
+    Games by name.
+
+    Games are declared with a manifest (module, player limits) so that the
+    bot knows about them without importing them. A game's module is imported
+    the first time the game is needed, or ahead of time by `prewarm`, and
+    the time each import took is kept for `report`.
+    '''
+
     _registry: dict = None
 
     def __init__(self):
         self._registry = dict()
+        self._manifests = dict()
+        self._import_times = dict()
+
+    def declare(self, name, module, players=(1, None)):
+        self._manifests[name] = Manifest(name, module, *players)
 
     def register(self, name, cls):
+        # Games imported directly, without a manifest, declare themselves
+        if name not in self._manifests:
+            self._manifests[name] = Manifest(name, cls.__module__)
+
         self._registry[name] = cls
 
+    def exists(self, name):
+        return name in self._manifests
+
+    def manifest(self, name):
+        return self._manifests.get(name)
+
     def get(self, name):
+        '''
+        The game's class, importing its module if needed. None if the game
+        is unknown or its module failed to import.
+        '''
+        cls = self._registry.get(name)
+        if cls or name not in self._manifests:
+            return cls
+
+        return self.load(name)
+
+    def loaded(self, name):
+        '''
+        The game's class if its module has been imported, without importing it.
+        '''
+        return self._registry.get(name)
+
+    def load(self, name):
+        manifest = self._manifests[name]
+        start = time.perf_counter()
+
+        try:
+            importlib.import_module(manifest.module)
+        except Exception:
+            logger.exception(f'Failed to import {name} from {manifest.module}')
+            self._import_times.setdefault(name, None)
+            return None
+
+        if self._import_times.get(name) is None:
+            self._import_times[name] = time.perf_counter() - start
+            logger.info(f'Imported {name} in {self._import_times[name] * 1000:.0f}ms')
+
         return self._registry.get(name)
 
+    async def prewarm(self, names=None):
+        '''
+        Import games in the background, one per pass of the event loop, so
+        the first game played doesn't wait for its import. Imports run on
+        the loop's thread: registering a game touches the registry and the
+        preferences, which aren't safe to use from another thread.
+        '''
+        for name in list(names or self._manifests):
+            if name not in self._registry:
+                self.load(name)
+                await asyncio.sleep(0)
+
+    def report(self):
+        '''
+        Seconds each imported game took to import (None if it failed).
+        '''
+        return dict(self._import_times)
+
     def all(self):
-        return self._registry.keys()
+        return self._manifests.keys()
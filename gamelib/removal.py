@@ -0,0 +1,164 @@
+import asyncio
+import logging
+
+from collections import OrderedDict
+
+from discord.errors import NotFound
+
+from .outbound import REMOVAL, CLEANUP, Dropped, route
+
+logger = logging.getLogger('bot')
+
+
+class ReactionRemover:
+    '''
+    Removes user reactions in the background.
+
+    Removals are grouped per message and duplicates are dropped. Each
+    message has at most one batch in flight, and removals queued meanwhile
+    make up its next batch. Batches for different messages don't wait on
+    each other, the outbound scheduler throttles each channel on its own.
+    They are sent after board edits and controls, but never dropped for
+    waiting too long: a reaction that stays on a control makes it dead for
+    that player.
+    '''
+
+    def __init__(self, outbound):
+        self.outbound = outbound
+        self._pending = OrderedDict()
+        self._sending = dict()
+        self._wakeup = None
+        self._task = None
+
+        self.removed = 0
+        self.duplicates = 0
+        self.discarded = 0
+        self.dropped = 0
+
+    def remove(self, reaction, user):
+        '''
+        Queue the removal of `user`'s `reaction`.
+        '''
+        message = reaction.message
+        if message.id not in self._pending:
+            self._pending[message.id] = (message, OrderedDict())
+
+        removals = self._pending[message.id][1]
+        key = (str(reaction.emoji), user.id)
+
+        if key in removals:
+            self.duplicates += 1
+            return
+
+        removals[key] = (reaction.emoji, user)
+        self._wake()
+
+    def discard(self, message):
+        '''
+        Forget pending removals for `message`, e.g. because its reactions are
+        about to be cleared.
+        '''
+        entry = self._pending.pop(message.id, None)
+        if entry:
+            self.discarded += len(entry[1])
+
+    async def clear(self, message):
+        '''
+        Clear all reactions from `message`, dropping pending removals for it.
+        '''
+        self.discard(message)
+
+        try:
+            await self.outbound.request(CLEANUP, route('reaction', message), message.clear_reactions)
+        except (Dropped, NotFound):
+            pass
+
+    async def drain(self, timeout=None):
+        '''
+        Wait until every queued removal has been sent, or until `timeout`
+        seconds have passed.
+        '''
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+
+        while self._pending or self._sending:
+            remaining = deadline - loop.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+
+            if self._sending:
+                await asyncio.wait([task for task, _ in self._sending.values()], timeout=remaining)
+            else:
+                # The worker hasn't picked them up yet
+                await asyncio.sleep(0)
+
+    def stop(self):
+        '''
+        Stop the worker and give up on removals that haven't been sent.
+        '''
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+        lost = sum(len(removals) for _, removals in self._pending.values())
+        for task, count in self._sending.values():
+            task.cancel()
+            lost += count
+
+        if lost:
+            logger.warning(f'Gave up on {lost} reaction removals on shutdown')
+
+        self._pending.clear()
+        self._sending.clear()
+
+    def stats(self):
+        return {
+            'removed': self.removed,
+            'duplicates': self.duplicates,
+            'discarded': self.discarded,
+            'dropped': self.dropped,
+            'pending': sum(len(removals) for _, removals in self._pending.values()),
+            'sending': len(self._sending),
+        }
+
+    def _wake(self):
+        if not self._wakeup:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+
+        if not self._task:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+
+            for message_id in [id for id in self._pending if id not in self._sending]:
+                message, removals = self._pending.pop(message_id)
+                task = asyncio.ensure_future(self._send(message, removals))
+                task.add_done_callback(lambda _, id=message_id: self._sent(id))
+                self._sending[message_id] = (task, len(removals))
+
+            await self._wakeup.wait()
+
+    def _sent(self, message_id):
+        self._sending.pop(message_id, None)
+        # Removals queued while the batch was out go next
+        if message_id in self._pending:
+            self._wake()
+
+    async def _send(self, message, removals):
+        results = await asyncio.gather(*(
+            self.outbound.request(REMOVAL, route('reaction', message), message.remove_reaction, emoji, user)
+            for emoji, user in removals.values()
+        ), return_exceptions=True)
+
+        for result in results:
+            if isinstance(result, Dropped):
+                self.dropped += 1
+            elif isinstance(result, NotFound):
+                pass
+            elif isinstance(result, Exception):
+                logger.error(f'Failed to remove reaction from message {message.id}: {result}')
+            else:
+                self.removed += 1
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+
+from discord.errors import NotFound
+
+from .outbound import RENDER, route
+
+logger = logging.getLogger('bot')
+
+
+class RenderScheduler:
+    '''
+    Coalesces message edits so that only the latest state of a message is sent.
+
+    Games hand their newest payload to `edit`. While an edit for a message is
+    in flight, any further payloads for it replace each other, so a burst of
+    moves results in at most one trailing edit instead of one edit per move.
+    '''
+
+    def __init__(self, outbound):
+        self.outbound = outbound
+        self._pending = dict()
+        self._tasks = dict()
+        self.sent = 0
+        self.dropped = 0
+
+    def edit(self, message, **fields):
+        '''
+        Queue an edit of `message`, replacing any edit that has not been sent yet.
+        Use `flush` to wait for the message to be up to date.
+        '''
+        if message.id in self._pending:
+            self.dropped += 1
+
+        self._pending[message.id] = (message, fields)
+
+        if message.id not in self._tasks:
+            self._tasks[message.id] = asyncio.ensure_future(self._drain(message.id))
+
+    async def flush(self, message=None, timeout=None):
+        '''
+        Wait until pending edits for `message` (or every message) are sent,
+        or until `timeout` seconds have passed.
+        '''
+        if message:
+            tasks = [self._tasks[message.id]] if message.id in self._tasks else []
+        else:
+            tasks = list(self._tasks.values())
+
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+    def discard(self, message):
+        '''
+        Drop the edit that is waiting to be sent for `message`, if any.
+        '''
+        if self._pending.pop(message.id, None):
+            self.dropped += 1
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'pending': len(self._pending),
+        }
+
+    async def _drain(self, message_id):
+        try:
+            while message_id in self._pending:
+                message, fields = self._pending.pop(message_id)
+
+                try:
+                    await self.outbound.request(RENDER, route('edit', message), message.edit, **fields)
+                    self.sent += 1
+                except NotFound:
+                    self._pending.pop(message_id, None)
+                except Exception:
+                    logger.exception(f'Failed to edit message {message_id}')
+        finally:
+            self._tasks.pop(message_id, None)
@@ -1,87 +1,369 @@
-from collections import defaultdict
+import time
+import asyncio
+import logging
 
+from collections import defaultdict, Counter
+
+from .actor import Actor
 from .database import Database
+from .metrics import Metrics
+from .removal import ReactionRemover
+from .timers import TimingWheel
+
+logger = logging.getLogger('bot')
+
+
+class _Session:
+    __slots__ = ('app', 'key', 'channel_id', 'guild_id', 'actor', 'messages')
+
+    def __init__(self, app, key, channel_id, guild_id, metrics=None):
+        self.app = app
+        self.key = key
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.actor = Actor(app, metrics=metrics)
+        self.messages = dict()
+
 
 class SessionManager:
-    def __init__(self, db: Database):
+    '''
+    Keeps track of running sessions.
+
+    Sessions are indexed by session key (the set of player ids), player,
+    channel, guild and message. All indexes are updated together in `add`,
+    `remove` and the message (un)registration methods, and every operation
+    is O(1) in the number of sessions.
+    '''
+
+    # Sessions ended at once, and the overall deadline, when shutting down
+    SHUTDOWN_CONCURRENCY = 16
+    SHUTDOWN_TIMEOUT = 20.0
+    # How long cancelled sessions get to stop, after the deadline
+    CANCEL_TIMEOUT = 2.0
+    # How long an expiring session's current event gets to finish
+    EXPIRE_WAIT = 10.0
+
+    def __init__(self, db: Database, timers: TimingWheel, remover: ReactionRemover, metrics: Metrics = None):
         self.db = db
+        self.timers = timers
+        self.remover = remover
+        self.metrics = metrics
+        self.expired = {'idle': 0, 'absolute': 0}
+        # Events shed by sessions that have since ended, per game
+        self._shed = Counter()
+        self._reset()
+
+
+    def _reset(self):
+        self._records = dict()
         self._sessions = dict()
-        self._players = defaultdict(list)
+        self._players = defaultdict(set)
+        self._channels = defaultdict(set)
+        self._guilds = defaultdict(set)
         self._messages = dict()
+        self._game_counts = Counter()
+        self._guild_counts = Counter()
+
+
+    def __len__(self):
+        return len(self._records)
 
 
     def add(self, players, app):
-        if self.get(players):
+        key = SessionManager.hash(players)
+        if key in self._sessions:
             return False
 
-        sessionId = SessionManager.hash(players)
-        self._sessions[sessionId] = app
+        channel = getattr(app, 'channel', None)
+        guild = getattr(channel, 'guild', None)
+        record = _Session(
+            app, key,
+            channel.id if channel else None,
+            guild.id if guild else None,
+            self.metrics
+        )
+
+        self._records[app] = record
+        self._sessions[key] = app
+
+        for player_id in key:
+            self._players[player_id].add(app)
+
+        self._index(self._channels, record.channel_id, app)
+        self._index(self._guilds, record.guild_id, app)
 
-        for player in players:
-            self._players[player.id].append(app)
+        self._game_counts[app.app_name] += 1
+        if record.guild_id is not None:
+            self._guild_counts[record.guild_id] += 1
+
+        max_duration = getattr(app, 'MAX_DURATION', None)
+        if max_duration:
+            self.timers.schedule(('absolute', app), max_duration, self._expire, app, 'absolute')
+        self.touch(app)
 
         return True
 
 
     def pop(self, players):
-        try:
-            sessionId = SessionManager.hash(players)
-            app = self._sessions.pop(sessionId)
+        app = self._sessions.get(SessionManager.hash(players))
+        if app:
+            self.remove(app)
+        return app
+
+
+    def remove(self, app):
+        '''
+        Drop a session and everything indexed for it, including its messages.
+        '''
+        record = self._records.pop(app, None)
+        if not record:
+            return False
 
-            if app:
-                for player in set(players):
-                    self._players[player.id].remove(app)
+        record.actor.close()
+        self.timers.cancel(('idle', app))
+        self.timers.cancel(('absolute', app))
 
-                    if len(self._players[player.id]) == 0:
-                        self._players.pop(player.id)
+        if record.actor.shed:
+            self._shed[app.app_name] += record.actor.shed
 
-                return app
+        self._sessions.pop(record.key, None)
 
-            return None
-        except KeyError as e:
-            return None
+        for player_id in record.key:
+            self._unindex(self._players, player_id, app)
+
+        self._unindex(self._channels, record.channel_id, app)
+        self._unindex(self._guilds, record.guild_id, app)
+
+        for message_id in record.messages:
+            self._messages.pop(message_id, None)
+
+        self._uncount(self._game_counts, app.app_name)
+        if record.guild_id is not None:
+            self._uncount(self._guild_counts, record.guild_id)
+
+        return True
 
 
     def get(self, players):
-        try:
-            sessionId = SessionManager.hash(players)
-            return self._sessions[sessionId]
-        except KeyError:
-            return None
+        return self._sessions.get(SessionManager.hash(players))
+
+
+    async def killall(self, concurrency=None, timeout=None, keep=()):
+        '''
+        End every session, at most `concurrency` at a time. Sessions that have
+        not ended within `timeout` seconds are dropped without finishing.
+        Sessions in `keep` (e.g. saved for resuming) are dropped without
+        being ended. Returns a report with the outcome and timing of each
+        session.
+        '''
+        concurrency = concurrency or self.SHUTDOWN_CONCURRENCY
+        timeout = timeout or self.SHUTDOWN_TIMEOUT
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+
+        for app, record in self._records.items():
+            record.actor.close()
+            self.timers.cancel(('idle', app))
+            self.timers.cancel(('absolute', app))
+
+        limit = asyncio.Semaphore(concurrency)
+        ending = [app for app in self._records if app not in keep]
+        records = dict(self._records)
+        report = [
+            {'game': app.app_name, 'players': sorted(self._records[app].key), 'status': 'dropped', 'seconds': None}
+            for app in ending
+        ]
+
+        async def end(app, entry):
+            async with limit:
+                start = time.perf_counter()
+                entry['status'] = 'timeout'
+                try:
+                    # The event being handled finishes first, games never run two at once
+                    await records[app].actor.stop(max(0.0, deadline - loop.time()))
+                    await app.end()
+                    entry['status'] = 'ended'
+                except Exception as err:
+                    entry['status'] = 'error'
+                    logger.error(f'Error ending {app.app_name} session: {err!r}')
+                finally:
+                    entry['seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tasks = [asyncio.ensure_future(end(app, entry)) for app, entry in zip(ending, report)]
+
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            # Give up on anything that doesn't even stop when cancelled
+            if pending:
+                await asyncio.wait(pending, timeout=self.CANCEL_TIMEOUT)
+
+        self._reset()
+
+        ended = sum(1 for entry in report if entry['status'] == 'ended')
+        logger.info(f'Ended {ended}/{len(report)} sessions in {time.perf_counter() - start:.2f}s, kept {len(keep)}')
+        for entry in report:
+            if entry['status'] != 'ended':
+                logger.info(f"  {entry['game']} {entry['players']}: {entry['status']}")
+
+        return report
+
+
+    def dispatch(self, app, event, **data):
+        '''
+        Post an event to the session's mailbox. Returns False if the session
+        is gone or its mailbox is full and the event was shed.
+        '''
+        record = self._records.get(app)
+        if not record:
+            return False
+
+        self.touch(app)
+        return record.actor.post(event, **data)
+
 
+    def touch(self, app):
+        '''
+        Restart the session's idle timeout.
+        '''
+        idle_timeout = getattr(app, 'IDLE_TIMEOUT', None)
+        if idle_timeout:
+            self.timers.schedule(('idle', app), idle_timeout, self._expire, app, 'idle')
 
-    async def killall(self):
-        for app in list(self._sessions.values()):
+
+    async def _expire(self, app, reason):
+        record = self._records.get(app)
+        # A closed actor means the session is already being ended
+        if not record or record.actor.closed:
+            return
+
+        self.expired[reason] += 1
+        logger.info(f'Ending {reason} {app.app_name} session')
+
+        # Let the event being handled finish before ending the game under it
+        await record.actor.stop(self.EXPIRE_WAIT)
+        if self._records.get(app) is not record:
+            return
+
+        messages = list(record.messages.values())
+
+        try:
             await app.end()
+            # Games clear their controls when they end, only tidy up after those that don't
+            leftover = [message for message in messages if message.id in record.messages]
+        except Exception:
+            logger.exception(f'Error ending expired {app.app_name} session')
+            leftover = messages
+
+        self.remove(app)
+
+        for message in leftover:
+            await self.remover.clear(message)
+
+
+    def all(self):
+        return list(self._records)
+
 
-        self._sessions = {}
-        self._players = {}
+    def get_app_messages(self, app):
+        record = self._records.get(app)
+        return list(record.messages.values()) if record else []
+
+
+    def actor_stats(self, app):
+        record = self._records.get(app)
+        return record.actor.stats() if record else None
+
+
+    def mailbox_stats(self):
+        '''
+        Per game: events waiting in its sessions' mailboxes, the deepest
+        mailbox, and events shed so far (including by ended sessions).
+        '''
+        stats = {game: {'depth': 0, 'depth_max': 0, 'shed': shed} for game, shed in self._shed.items()}
+
+        for app, record in self._records.items():
+            entry = stats.setdefault(app.app_name, {'depth': 0, 'depth_max': 0, 'shed': 0})
+            depth = record.actor.mailbox.qsize()
+            entry['depth'] += depth
+            entry['depth_max'] = max(entry['depth_max'], depth)
+            entry['shed'] += record.actor.shed
+
+        return stats
 
 
     def get_player_sessions(self, player):
-        try:
-            return self._players[player.id]
-        except KeyError:
-            return []
+        return set(self._players.get(player.id, ()))
+
+
+    def get_channel_sessions(self, channel):
+        return set(self._channels.get(channel.id, ()))
+
+
+    def get_guild_sessions(self, guild):
+        return set(self._guilds.get(guild.id, ()))
 
 
     def register_message(self, message, app):
+        record = self._records.get(app)
+        if not record:
+            return False
+
         self._messages[message.id] = app
+        record.messages[message.id] = message
+        return True
 
 
     def unregister_message(self, message):
-        try:
-            self._messages.pop(message.id)
-            return True
-        except KeyError:
+        app = self._messages.pop(message.id, None)
+        if not app:
             return False
 
+        record = self._records.get(app)
+        if record:
+            record.messages.pop(message.id, None)
+
+        return True
+
 
     def get_message_session(self, message):
-        try:
-            return self._messages[message.id]
-        except KeyError:
-            return None
+        return self._messages.get(message.id)
+
+
+    def counts(self):
+        '''
+        Number of sessions in total, per game and per guild.
+        '''
+        return {
+            'sessions': len(self._records),
+            'messages': len(self._messages),
+            'games': dict(self._game_counts),
+            'guilds': dict(self._guild_counts),
+        }
+
+
+    @staticmethod
+    def _index(index, key, app):
+        if key is not None:
+            index[key].add(app)
+
+
+    @staticmethod
+    def _unindex(index, key, app):
+        apps = index.get(key)
+        if apps is not None:
+            apps.discard(app)
+            if not apps:
+                del index[key]
+
+
+    @staticmethod
+    def _uncount(counter, key):
+        counter[key] -= 1
+        if counter[key] <= 0:
+            del counter[key]
 
 
     @staticmethod
@@ -0,0 +1,294 @@
+import json
+import time
+import asyncio
+import logging
+
+import discord
+
+from .files import atomic_write
+from .registry import Registry
+from .session import SessionManager
+from .timers import TimingWheel
+
+logger = logging.getLogger('bot')
+
+
+class SnapshotStore:
+    '''
+    Reads and atomically writes session snapshots as a JSON file.
+    '''
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        except ValueError:
+            logger.error(f'Ignoring unreadable session snapshot {self.path}')
+            return []
+
+        if data.get('version') != self.VERSION:
+            return []
+
+        return data.get('sessions', [])
+
+    def save(self, sessions):
+        with atomic_write(self.path) as f:
+            json.dump({'version': self.VERSION, 'sessions': sessions}, f, separators=(',', ':'))
+
+
+class Resumer:
+    '''
+    Saves running sessions and brings them back after a restart.
+
+    Loading a snapshot only indexes its entries by message and players. A
+    session is rehydrated (users, channel and messages fetched, game state
+    restored) the first time someone reacts to one of its messages, so the
+    size of the snapshot does not affect startup time. Entries that have not
+    been resumed yet are carried over into the next snapshot, until they are
+    older than their game's idle timeout or maximum duration.
+
+    Messages from before a restart are not in discord.py's message cache, so
+    reactions to them only arrive as raw events; `reaction` turns those into
+    regular reactions for the games.
+    '''
+
+    # Seconds between periodic snapshots
+    INTERVAL = 60
+    # Seconds a saved session is kept if its game isn't loaded to tell
+    MAX_AGE = 6 * 60 * 60
+
+    def __init__(self, store: SnapshotStore, sessions: SessionManager, registry: Registry, timers: TimingWheel):
+        self.store = store
+        self.sessions = sessions
+        self.registry = registry
+        self.timers = timers
+
+        self.loaded = False
+        self._pending = dict()
+        self._by_message = dict()
+        self._resuming = dict()
+        self._messages = dict()
+
+        self.resumed = 0
+        self.failed = 0
+
+    async def load(self):
+        if self.loaded:
+            return
+
+        entries = await asyncio.get_event_loop().run_in_executor(None, self.store.load)
+        now = time.time()
+        entries = [entry for entry in entries if not self._expired(entry, now)]
+        for entry in entries:
+            self._add(entry)
+
+        self.loaded = True
+        logger.info(f'Loaded {len(entries)} resumable sessions')
+
+    def start(self, interval=None):
+        '''
+        Save a snapshot every `interval` seconds.
+        '''
+        interval = interval or self.INTERVAL
+
+        async def tick():
+            self.timers.schedule('snapshot', interval, tick)
+            try:
+                await self.save()
+            except Exception:
+                logger.exception('Failed to save session snapshot')
+
+        self.timers.schedule('snapshot', interval, tick)
+
+    def stop(self):
+        self.timers.cancel('snapshot')
+
+    def snapshot(self):
+        '''
+        Serialize every resumable session. Returns (entries, apps saved).
+        '''
+        entries = []
+        saved = []
+        now = time.time()
+
+        for app in self.sessions.all():
+            snapshot = getattr(app, 'snapshot', None)
+
+            # Sessions still starting don't have all of their state yet
+            if not snapshot or not getattr(app, '_playable', True):
+                continue
+
+            try:
+                state = snapshot()
+                if state is None:
+                    continue
+
+                entries.append({
+                    'game': app.app_name,
+                    'players': [player.id for player in app._players],
+                    'channel': app.channel.id,
+                    'messages': [message.id for message in self.sessions.get_app_messages(app)],
+                    'state': state,
+                    'started': getattr(app, 'started', now),
+                    'saved': now,
+                })
+            except Exception:
+                logger.exception(f'Failed to snapshot {app.app_name} session')
+                continue
+
+            saved.append(app)
+
+        for entry in list(self._pending.values()):
+            if self._expired(entry, now):
+                self._remove(entry)
+
+        entries.extend(self._pending.values())
+        return entries, saved
+
+    async def save(self):
+        '''
+        Write a snapshot of every resumable session. Returns the apps saved.
+        '''
+        # Never overwrite sessions that have not been read yet
+        await self.load()
+
+        entries, saved = self.snapshot()
+        await asyncio.get_event_loop().run_in_executor(None, self.store.save, entries)
+        return saved
+
+    def tracks(self, message_id):
+        return message_id in self._by_message or message_id in self._messages
+
+    async def reaction(self, bot, payload):
+        '''
+        Build a (reaction, user) pair from a raw reaction event on a message
+        of a saved or resumed session, resuming the session if needed.
+        '''
+        entry = self._by_message.get(payload.message_id)
+        if entry:
+            await self._resume(bot, entry)
+
+        message = self._messages.get(payload.message_id)
+        if not message:
+            return None, None
+
+        if not self.sessions.get_message_session(message):
+            self._messages.pop(message.id)
+            return None, None
+
+        emoji = payload.emoji.name if payload.emoji.is_unicode_emoji() else payload.emoji
+        reaction = discord.Reaction(message=message, data={'count': 1, 'me': False}, emoji=emoji)
+        user = payload.member or await self._fetch_user(bot, payload.user_id)
+
+        return reaction, user
+
+    def discard(self, players):
+        '''
+        Forget a saved session, e.g. because its players started a new game.
+        '''
+        entry = self._pending.get(SessionManager.hash(players))
+        if entry:
+            self._remove(entry)
+
+    async def resume_players(self, bot, players):
+        entry = self._pending.get(SessionManager.hash(players))
+        return await self._resume(bot, entry) if entry else None
+
+    def _key(self, entry):
+        return frozenset(entry['players'])
+
+    def _add(self, entry):
+        self._pending[self._key(entry)] = entry
+        for message_id in entry['messages']:
+            self._by_message[message_id] = entry
+
+    def _remove(self, entry):
+        self._pending.pop(self._key(entry), None)
+        for message_id in entry['messages']:
+            self._by_message.pop(message_id, None)
+
+    async def _resume(self, bot, entry):
+        key = self._key(entry)
+
+        # Several reactions may arrive before the session is back
+        if key not in self._resuming:
+            self._resuming[key] = asyncio.ensure_future(self._rehydrate(bot, entry))
+
+        try:
+            return await asyncio.shield(self._resuming[key])
+        finally:
+            if self._resuming.get(key) and self._resuming[key].done():
+                self._resuming.pop(key, None)
+
+    async def _rehydrate(self, bot, entry):
+        self._remove(entry)
+
+        try:
+            game_cls = self.registry.get(entry['game'])
+            if not game_cls:
+                raise LookupError(f"unknown game {entry['game']}")
+
+            if self._expired(entry, time.time(), game_cls):
+                raise LookupError('session expired while the bot was away')
+
+            channel = bot.get_channel(entry['channel']) or await bot.fetch_channel(entry['channel'])
+            players = await asyncio.gather(*(self._fetch_user(bot, id) for id in entry['players']))
+            messages = await asyncio.gather(*(channel.fetch_message(id) for id in entry['messages']))
+
+            if self.sessions.get(players):
+                raise LookupError('players already started a new game')
+
+            app = await game_cls.restore(bot, list(players), channel, list(messages), entry['state'])
+            app.started = entry.get('started', app.started)
+            # It was playable before the restart, and has its messages already
+            app._playable = True
+            await app.load_preferences()
+        except (discord.HTTPException, NotImplementedError, LookupError, KeyError, IndexError, ValueError) as err:
+            self.failed += 1
+            logger.info(f"Could not resume {entry['game']} session: {err!r}")
+            return None
+
+        self.sessions.add(app._players, app)
+        for message in messages:
+            app.register_message(message)
+            self._messages[message.id] = message
+
+        self.resumed += 1
+        # Through the actor, like any other event for the session
+        self.sessions.dispatch(app, 'resumed')
+        return app
+
+    def _expired(self, entry, now, game_cls=None):
+        '''
+        Whether a saved session would have been ended by now. Entries from
+        before save times were recorded count as expired.
+        '''
+        saved = entry.get('saved')
+        if saved is None:
+            return True
+
+        game_cls = game_cls or self.registry.loaded(entry['game'])
+        if not game_cls:
+            return now - saved > self.MAX_AGE
+
+        idle_timeout = getattr(game_cls, 'IDLE_TIMEOUT', None)
+        max_duration = getattr(game_cls, 'MAX_DURATION', None)
+
+        return bool(
+            (idle_timeout and now - saved > idle_timeout)
+            or (max_duration and now - entry.get('started', saved) > max_duration)
+        )
+
+    @staticmethod
+    async def _fetch_user(bot, id):
+        if bot.user and bot.user.id == id:
+            return bot.user
+        return bot.get_user(id) or await bot.fetch_user(id)
+
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import math
+
+logger = logging.getLogger('bot')
+
+
+class _Timer:
+    __slots__ = ('key', 'due', 'slot', 'fn', 'args')
+
+    def __init__(self, key, due, slot, fn, args):
+        self.key = key
+        self.due = due
+        self.slot = slot
+        self.fn = fn
+        self.args = args
+
+
+class TimingWheel:
+    '''
+    Hashed timing wheel for keyed timers.
+
+    Timers are hashed into `slots` buckets by the tick they are due on, so
+    scheduling and cancelling are O(1) no matter how many timers are pending.
+    A single task drives the wheel, and only while timers are pending. Timers
+    fire up to one tick late.
+
+    Every timer has a key; scheduling a key that is already pending replaces
+    its timer, which is what per-object debouncing needs.
+    '''
+
+    TICK = 0.1
+    SLOTS = 512
+
+    def __init__(self, tick=None, slots=None):
+        self.tick = tick or self.TICK
+        self.slots = slots or self.SLOTS
+
+        self._wheel = [dict() for _ in range(self.slots)]
+        self._timers = dict()
+        self._start = None
+        self._processed = 0
+        self._task = None
+        self._wakeup = None
+
+        self.fired = 0
+
+    def __len__(self):
+        return len(self._timers)
+
+    def __contains__(self, key):
+        return key in self._timers
+
+    def schedule(self, key, delay, fn, *args):
+        '''
+        Call `fn(*args)` after `delay` seconds, replacing any timer for `key`.
+        Coroutine functions are run as tasks.
+        '''
+        self.cancel(key)
+
+        due = self._now_tick() + max(1, math.ceil(delay / self.tick))
+        timer = _Timer(key, due, due % self.slots, fn, args)
+
+        self._wheel[timer.slot][key] = timer
+        self._timers[key] = timer
+        self._wake()
+
+    def cancel(self, key):
+        timer = self._timers.pop(key, None)
+        if not timer:
+            return False
+
+        del self._wheel[timer.slot][key]
+        return True
+
+    def debounce(self, key, wait, fn, *args):
+        '''
+        Call `fn(*args)` once `wait` seconds pass without another call for `key`.
+        '''
+        self.schedule(key, wait, fn, *args)
+
+    def throttle(self, key, interval, fn, *args):
+        '''
+        Call `fn` at most once per `interval` for `key`, with the latest `args`.
+        '''
+        timer = self._timers.get(key)
+        if timer:
+            timer.fn = fn
+            timer.args = args
+        else:
+            self.schedule(key, interval, fn, *args)
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+        for slot in self._wheel:
+            slot.clear()
+        self._timers.clear()
+
+    def _loop(self):
+        return asyncio.get_event_loop()
+
+    def _now_tick(self):
+        if self._start is None:
+            self._start = self._loop().time()
+        return int((self._loop().time() - self._start) / self.tick)
+
+    def _wake(self):
+        if not self._wakeup:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+
+        if not self._task:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            if not self._timers:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                # Nothing was due while idle, skip ahead
+                self._processed = self._now_tick()
+                continue
+
+            next_tick = self._processed + 1
+            delay = self._start + next_tick * self.tick - self._loop().time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            self._advance(self._now_tick())
+
+    def _advance(self, now):
+        # After a stall, one pass over the wheel visits every slot
+        first = max(self._processed + 1, now - self.slots + 1)
+
+        for tick in range(first, now + 1):
+            slot = self._wheel[tick % self.slots]
+            if not slot:
+                continue
+
+            due = [timer for timer in slot.values() if timer.due <= now]
+            for timer in due:
+                del slot[timer.key]
+                del self._timers[timer.key]
+                self._fire(timer)
+
+        self._processed = now
+
+    def _fire(self, timer):
+        self.fired += 1
+
+        try:
+            result = timer.fn(*timer.args)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result)
+        except Exception:
+            logger.exception(f'Timer {timer.key!r} failed')
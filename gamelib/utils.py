@@ -1,28 +1,26 @@
 import sys
+import time
+import random
 import logging
-import asyncio
+import functools
 
 from abc import abstractmethod, ABC, ABCMeta
 
 from discord.errors import NotFound
 
-from . import sessionManager, preferences
-
-loop = asyncio.get_event_loop()
+from . import sessionManager, preferences, controls, outbound, timers, profiler
+from .outbound import NOTIFY, CLEANUP, Dropped, route
+from .profiler import profiled
 
 def debounce(wait):
-    """ Decorator that will postpone a functions
+    """ Decorator that will postpone a method's
         execution until after wait seconds
-        have elapsed since the last time it was invoked. """
+        have elapsed since the last time it was
+        invoked on the same object. """
     def decorator(fn):
-        def debounced(*args, **kwargs):
-            def call_it():
-                asyncio.create_task(fn(*args, **kwargs))
-            try:
-                debounced.t.cancel()
-            except AttributeError:
-                pass
-            debounced.t = loop.call_later(wait, call_it)
+        def debounced(obj, *args, **kwargs):
+            timers.debounce((fn, obj), wait, functools.partial(fn, obj, *args, **kwargs))
+        debounced.cancel = lambda obj: timers.cancel((fn, obj))
         return debounced
     return decorator
 
@@ -34,9 +32,28 @@ class GameConfigError(Exception):
 class BaseBotApp(metaclass=ABCMeta):
     # __metaclass__ = ABCMeta
 
+    # Seconds without events, and in total, before a session is ended.
+    # Override with register(name, idle_timeout=..., max_duration=...)
+    IDLE_TIMEOUT = 15 * 60
+    MAX_DURATION = 6 * 60 * 60
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # Every game can be profiled with g!profile
+        for name in ('begin', 'handle'):
+            if name in cls.__dict__:
+                setattr(cls, name, profiled(profiler, cls.__dict__[name]))
+
     def __init__(self, name: str, players):
         self.app_name = name
         self._players = players
+        self._created = time.monotonic()
+        self._playable = False
+        # Wall clock time, kept across restarts by the resumer
+        self.started = time.time()
+        self.random = random.Random()
+        self.prefs = None
 
     @abstractmethod
     async def begin(self, bot, message, player1, player2):
@@ -45,6 +62,13 @@ class BaseBotApp(metaclass=ABCMeta):
         '''
         raise NotImplementedError
 
+    async def start(self):
+        '''
+        Load every player's preferences in one query, then begin.
+        '''
+        await self.load_preferences()
+        await self.begin()
+
     @abstractmethod
     async def end(self):
         '''
@@ -61,13 +85,69 @@ class BaseBotApp(metaclass=ABCMeta):
         '''
         raise NotImplementedError
 
+    def snapshot(self):
+        '''
+        Return the game's state as JSON-serializable data so that it can be
+        resumed after a restart, or None if the game can't be resumed.
+        '''
+        return None
+
+    @classmethod
+    async def restore(cls, bot, players, channel, messages, state):
+        '''
+        Recreate a game from `snapshot` data. `messages` are the game's
+        registered messages, in the order they were registered. Once the
+        session is tracked again it gets a 'resumed' event, e.g. to finish
+        a move that was in progress when it was saved.
+        '''
+        raise NotImplementedError
+
     # Utilities
 
-    def preference(self, player, key):
-        return preferences.get(player, self.app_name, key)
+    def random_seed(self):
+        '''
+        Reseed the game's RNG and return the seed, so that a restored game
+        continues with the same random sequence.
+        '''
+        seed = self.random.getrandbits(64)
+        self.random.seed(seed)
+        return seed
+
+    @property
+    def guild(self):
+        return getattr(getattr(self, 'channel', None), 'guild', None)
+
+    async def load_preferences(self):
+        self.prefs = await preferences.view(self.app_name, self._players, self.guild)
+
+    def push_preferences(self, player, prefs):
+        '''
+        Replace a player's preferences in the session's view after they changed.
+        '''
+        if self.prefs:
+            self.prefs.push(player, prefs)
+
+    def push_guild_preferences(self, guild_prefs):
+        if self.prefs:
+            self.prefs.push_guild(guild_prefs)
+
+    def preference(self, player, key, default=None):
+        '''
+        The player's setting, resolved through their global setting and the
+        guild's defaults, or else `default`, or else the declared default.
+        Before the session's preferences are loaded, only cached preferences
+        are used, so this never waits for storage.
+        '''
+        if self.prefs:
+            return self.prefs.get(player, key, default)
+
+        return preferences.get(player, self.app_name, key, default, self.guild)
+
+    async def apreference(self, player, key, default=None):
+        return await preferences.aget(player, self.app_name, key, default, self.guild)
 
     def end_session(self):
-        sessionManager.pop(self._players)
+        sessionManager.remove(self)
 
     def register_message(self, message):
         return sessionManager.register_message(message, self)
@@ -75,6 +155,14 @@ class BaseBotApp(metaclass=ABCMeta):
     def unregister_message(self, message):
         return sessionManager.unregister_message(message)
 
+    def mark_playable(self):
+        '''
+        Report the time from game creation until the board could be played.
+        '''
+        if not self._playable:
+            self._playable = True
+            controls.record_playable(self.app_name, time.monotonic() - self._created)
+
 
 class MagicMessage:
     def __init__(self, channel):
@@ -82,14 +170,31 @@ class MagicMessage:
         self.message = None
         self.ended = False
 
-    async def send(self, text):
-        if not self.message:
-            return await self._send(text)
+    @classmethod
+    async def restore(cls, channel, message_id):
+        magic = cls(channel)
+        if message_id:
+            try:
+                magic.message = await channel.fetch_message(message_id)
+            except NotFound:
+                pass
+        return magic
+
+    @property
+    def message_id(self):
+        return self.message.id if self.message else None
 
+    async def send(self, text):
         try:
-            await self._edit(text)
-        except NotFound:
-            return await self._send(text)
+            if not self.message:
+                return await self._send(text)
+
+            try:
+                await self._edit(text)
+            except NotFound:
+                return await self._send(text)
+        except Dropped:
+            return
 
         # Delete & resend message after a certain delay
         self._resend(text)
@@ -103,27 +208,27 @@ class MagicMessage:
     @debounce(5)
     async def _resend(self, text):
         if not self.ended:
-            await self._delete()
-            await self._send(text)
+            try:
+                await self._delete()
+                await self._send(text)
+            except Dropped:
+                pass
 
     async def _send(self, text):
-        self.message = await self.channel.send(text)
+        self.message = await outbound.request(NOTIFY, route('send', self.channel), self.channel.send, text)
 
     async def _edit(self, text):
-        await self.message.edit(content=text)
+        await outbound.request(NOTIFY, route('edit', self.message), self.message.edit, content=text)
 
     async def _delete(self):
         if self.message:
             try:
-                await self.message.delete()
-            except NotFound:
+                await outbound.request(CLEANUP, route('delete', self.message), self.message.delete)
+            except (NotFound, Dropped):
                 pass
 
     def _cancel(self):
-        try:
-            self.delay.t.cancel()
-        except AttributeError:
-            pass
+        MagicMessage._resend.cancel(self)
 
 
 def setupLogger():
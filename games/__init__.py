@@ -1,3 +1,18 @@
-from .game2048 import *
-from .connect4 import *
-from .tictactoe import *
+'''
+The games the bot knows about. Modules are imported the first time their
+game is played, so adding a game here doesn't slow down startup.
+'''
+from gamelib import declare
+from gamelib.preferences import Color, Emoji, Enum
+
+declare('2048', 'games.game2048', players=(1, None))
+
+declare('connect4', 'games.connect4', players=(2, 2), prefs={
+    'emoji': Emoji('Game board emoji'),
+    'color': Color('Message embed color'),
+    'difficulty': Enum('How well the bot plays against you', ['easy', 'medium', 'hard'], default='medium'),
+})
+
+declare('tictactoe', 'games.tictactoe', players=(2, 2), prefs={
+    'difficulty': Enum('How well the bot plays against you', ['easy', 'medium', 'hard'], default='medium'),
+})
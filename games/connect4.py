@@ -1,16 +1,23 @@
+import os
+import asyncio
+import logging
+
 import discord
-import random
 
-from gamelib import register, preferences
+from gamelib import register, preferences, renderer, controls, remover, outbound, compute
+from gamelib.outbound import RENDER, route
 from gamelib.utils import BaseBotApp, MagicMessage, GameConfigError
 
+from engines.connect4 import Connect4Engine
+from engines.connect4_search import best_move
+from engines.connect4_book import OpeningBook
+
 GAME_NAME = 'connect4'
-PREFERENCES = {
-    'emoji': 'Game board emoji',
-    'color': 'Message embed color'
-}
+logger = logging.getLogger('bot')
+# Built by tools/connect4_book.py, the bot searches every move without it
+book = OpeningBook.open(os.environ.get('GAMEBOT_CONNECT4_BOOK', os.path.join('books', 'connect4.book')))
 
-@register(name=GAME_NAME, prefs=PREFERENCES)
+@register(name=GAME_NAME)
 class GameConnect4(BaseBotApp):
     BOARD_X = 7
     BOARD_Y = 6
@@ -19,8 +26,15 @@ class GameConnect4(BaseBotApp):
     BLANK_TILE = "➕"
     PRIMARY_TILE = "🟠"
     TERTIARY_TILE = "🔵"
-    PRIMARY_COLOR = (255,175,44)
-    TERTIARY_COLOR = (84,174,239)
+    PRIMARY_COLOR = 0xffaf2c
+    TERTIARY_COLOR = 0x54aeef
+    # Bot search depth and seconds per move
+    DIFFICULTY = {'easy': (2, 0.1), 'medium': (6, 0.5), 'hard': (42, 2.0)}
+    # The book is searched deeper than medium but not as long as hard, so
+    # it would make hard play worse
+    BOOK_DIFFICULTIES = ('medium',)
+    # Extra time for a worker to answer before a random move is played instead
+    SEARCH_GRACE = 1.0
 
     def __init__(self, bot, players: list, channel: discord.TextChannel):
         if len(players) < 2:
@@ -36,38 +50,64 @@ class GameConnect4(BaseBotApp):
         self.primary = players[0]
         self.tertiary = players[1]
 
+        self.players = [self.primary, self.tertiary]
+        self.engine = Connect4Engine()
+
+        self.current_player = self.primary
         self.has_buttons = False
         self.winner = None
 
     async def begin(self):
-        self.board = [[None for _ in range(0,7)] for _ in range(0,6)]
-
         if self.tertiary != self.bot.user:
-            self.current_player = random.choice([self.primary, self.tertiary])
-        else:
-            self.current_player = self.primary
+            self.engine = Connect4Engine(turn=self.random.randrange(2))
+            self.current_player = self.players[self.engine.turn]
 
         self.turn_message = MagicMessage(self.channel)
-        self.message = await self.channel.send(f'{self.primary.name} started session between {self.primary.name} and {self.tertiary.name}')
+        self.message = await outbound.request(
+            RENDER, route('send', self.channel), self.channel.send,
+            f'{self.primary.name} started session between {self.primary.name} and {self.tertiary.name}'
+        )
 
         await self.render_message()
         self.register_message(self.message)
+        self.mark_playable()
 
     async def end(self):
         await self.turn_message.cleanup()
-        await self.message.clear_reactions()
+        await remover.clear(self.message)
 
         self.unregister_message(self.message)
         self.end_session()
 
+    def snapshot(self):
+        engine = self.engine.serialize()
+        return {
+            'board': engine['board'],
+            'current': engine['turn'],
+            'turn_message': self.turn_message.message_id,
+            'seed': self.random_seed(),
+        }
+
+    @classmethod
+    async def restore(cls, bot, players, channel, messages, state):
+        game = cls(bot, players, channel)
+        game.engine = Connect4Engine.deserialize({'board': state['board'], 'turn': state['current']})
+        game.current_player = players[state['current']]
+        game.message = messages[0]
+        game.has_buttons = True
+        game.turn_message = await MagicMessage.restore(channel, state['turn_message'])
+        game.random.seed(state['seed'])
+
+        return game
+
     async def handle(self, event, **data):
         if event == 'reaction':
             user = data.get('user')
             reaction = data.get('reaction')
 
-            await reaction.remove(user)
+            remover.remove(reaction, user)
 
-            if self.is_player_current(user):
+            if self.is_player_current(user) and reaction.emoji in self.BUTTONS:
                 col = self.BUTTONS[reaction.emoji]
                 await self.play_move(col, user)
 
@@ -77,107 +117,101 @@ class GameConnect4(BaseBotApp):
         elif event == 'preference_change':
             await self.render_message()
 
+        elif event == 'resumed':
+            # Saved while the bot was searching, its move was never played
+            if self.is_bot_turn():
+                await self.play_bot_move()
+
     def is_completed(self):
-        return True if self.winner else False
+        return self.engine.is_over()
 
-    def detect_current_player_win(self):
-        for col in range(0, self.BOARD_X-3):
-            for row in range(0, self.BOARD_Y):
-                if self.board[row][col] == self.board[row][col+1] == self.board[row][col+2] == self.board[row][col+3] == self.current_player.id:
-                    return True
+    def apply_move(self, col):
+        self.engine.apply(col)
 
-        for row in range(0, self.BOARD_Y-3):
-            for col in range(0, self.BOARD_X):
-                if self.board[row][col] == self.board[row+1][col] == self.board[row+2][col] == self.board[row+3][col] == self.current_player.id:
-                    return True
+        if self.engine.winner() is not None:
+            self.winner = self.players[self.engine.winner()]
+        elif not self.engine.is_over():
+            self.current_player = self.players[self.engine.turn]
 
-        for row in range(3, self.BOARD_Y):
-            for col in range(0, self.BOARD_X-3):
-                if self.board[row][col] == self.board[row-1][col+1] == self.board[row-2][col+2] == self.board[row-3][col+3] == self.current_player.id:
-                    return True
+    async def play_move(self, col, user):
+        if col not in self.engine.legal_moves():
+            return False
 
-        for row in range(3, self.BOARD_Y):
-            for col in range(3, self.BOARD_X):
-                if self.board[row][col] == self.board[row-1][col-1] == self.board[row-2][col-2] == self.board[row-3][col-3] == self.current_player.id:
-                    return True
+        self.apply_move(col)
+        await self.render_message()
 
-        return False
+        if self.is_bot_turn():
+            await self.play_bot_move()
 
-    async def play_move(self, col, user):
-        ret_val = False
-        for y in range(5,-1,-1):
-            if not self.board[y][col]:
-                self.board[y][col] = user.id
-                if self.detect_current_player_win():
-                    self.winner = self.current_player
-                else:
-                    self.current_player = self.primary if self.is_player_current(self.tertiary) else self.tertiary
-                await self.render_message()
-                ret_val = True
-                break
-
-        # bot AI code
-        if self.tertiary.id == self.bot.user.id and self.is_player_current(self.tertiary):
-            cols = list(self.BUTTONS.values())
-            random.shuffle(cols)
-            escape = False
-            for col in cols:
-                if escape:
-                    break
-                for y in range(5,-1,-1):
-                    if not self.board[y][col]:
-                        self.board[y][col] = self.tertiary.id
-                        if self.detect_current_player_win():
-                            self.winner = self.current_player
-                        else:
-                            self.current_player = self.primary if self.is_player_current(self.tertiary) else self.tertiary
-                        await self.render_message()
-                        escape = True
-                        break
-
-        return ret_val
+        return True
+
+    def is_bot_turn(self):
+        return self.tertiary.id == self.bot.user.id and self.is_player_current(self.tertiary) and not self.is_completed()
+
+    async def play_bot_move(self):
+        self.apply_move(await self.bot_move())
+        await self.render_message()
+
+    async def bot_move(self):
+        '''
+        Look the bot's move up in the opening book, or search for it in a
+        worker process so that other sessions keep playing meanwhile.
+        '''
+        difficulty = self.preference(self.primary, 'difficulty', default='medium')
+        depth, budget = self.DIFFICULTY.get(difficulty, self.DIFFICULTY['medium'])
+
+        if book and difficulty in self.BOOK_DIFFICULTIES:
+            move = book.lookup(self.engine)
+            if move is not None:
+                return move
+
+        try:
+            move, _ = await compute.run(best_move, self.engine, depth, budget, timeout=budget + self.SEARCH_GRACE)
+            return move
+        except asyncio.TimeoutError:
+            logger.warning(f'Connect 4 search took longer than {budget + self.SEARCH_GRACE}s')
+        except Exception:
+            logger.exception('Connect 4 search failed')
+
+        return self.random.choice(self.engine.legal_moves())
 
     async def render_message(self):
-        if not self.winner:
-            header = f"It's your move, {self.current_player.name}"
-        else:
+        if self.winner:
             header = f"Congratulations, {self.winner.name}"
+        elif self.is_completed():
+            header = "It's a draw!"
+        else:
+            header = f"It's your move, {self.current_player.name}"
         container = discord.Embed(title=header, color=self.get_container_color())
         container.add_field(name=self.render_board(), value="⠀", inline=True)
-        await self.message.edit(content=f"{self.primary.mention} ⚔️ {self.tertiary.mention}", embed=container)
+        renderer.edit(self.message, content=f"{self.primary.mention} ⚔️ {self.tertiary.mention}", embed=container)
         await self.refresh_buttons()
 
-        if not self.winner:
+        if not self.is_completed():
             await self.turn_message.send(f'{self.current_player.mention} It\'s your turn in connect 4!')
 
     def is_player_current(self, player):
         return self.current_player == player
 
     def get_container_color(self):
-        primary_color = self.preference(self.primary, 'color') or self.PRIMARY_COLOR
-        tertiary_color = self.preference(self.tertiary, 'color') or self.TERTIARY_COLOR
+        if self.current_player == self.primary:
+            return self.preference(self.primary, 'color', default=self.PRIMARY_COLOR)
 
-        return discord.Color.from_rgb(*primary_color) if \
-            self.current_player == self.primary \
-            else discord.Color.from_rgb(*tertiary_color)
+        return self.preference(self.tertiary, 'color', default=self.TERTIARY_COLOR)
 
     def get_player_emojis(self):
-        primary_tile = self.preference(self.primary, 'emoji') or self.PRIMARY_TILE
-        tertiary_tile = self.preference(self.tertiary, 'emoji') or self.TERTIARY_TILE
+        primary_tile = self.preference(self.primary, 'emoji', default=self.PRIMARY_TILE)
+        tertiary_tile = self.preference(self.tertiary, 'emoji', default=self.TERTIARY_TILE)
 
         return primary_tile, tertiary_tile
 
     def render_board(self):
         primary_tile, tertiary_tile = self.get_player_emojis()
+        tiles = {None: self.BLANK_TILE, 0: primary_tile, 1: tertiary_tile}
         ret = ""
-        for y in self.board:
-            for tile in y:
-                if tile is self.primary.id:
-                    ret += f"{primary_tile}\t\t"
-                elif tile is self.tertiary.id:
-                    ret += f"{tertiary_tile}\t\t"
-                else:
-                    ret += f"{self.BLANK_TILE}\t\t"
+        for y in range(self.BOARD_Y):
+            for x in range(self.BOARD_X):
+                ret += f"{tiles[self.engine.get(y, x)]}\t\t"
             ret += "\n\n\n"
         if not self.winner:
             ret += '\t\t'.join(self.BUTTONS.keys())
@@ -186,9 +220,8 @@ class GameConnect4(BaseBotApp):
         return ret
 
     async def refresh_buttons(self):
-        if not self.winner and not self.has_buttons:
-            for emoji in self.BUTTONS.keys():
-                await self.message.add_reaction(emoji)
+        if not self.is_completed() and not self.has_buttons:
+            await controls.install(self.message, self.BUTTONS.keys())
             self.has_buttons = True
-        elif self.winner:
-            await self.message.clear_reactions()
+        elif self.is_completed():
+            await remover.clear(self.message)
@@ -1,12 +1,13 @@
 import asyncio
-import random
-import itertools
 
 import discord
 
-from gamelib import register
+from gamelib import register, renderer, controls, remover, outbound
+from gamelib.outbound import RENDER, route
 from gamelib.utils import BaseBotApp, GameConfigError
 
+from engines.base import IllegalMove
+from engines.game2048 import Game2048Engine
 from settings import Z
 
 # Game name
@@ -31,137 +32,16 @@ EMOJIS = {
     2048: '`2048`',
 }
 
-class Board:
-    def __init__(self):
-        self.board = [[0 for x in range(0,4)] for y in range(0,4)]
-        self.score = 0
-
-    def make_move(self, move):
-        moved  = False
-        moved |= self.shift(move)
-        moved |= self.merge(move)
-        moved |= self.shift(move)
-
-        if moved:
-            self.insert_random()
-
-        return moved, self.is_game_over()
-
-    def render_board(self):
-        b = f'Score: {self.score}\n\n'
-        for i in range(4):
-            for j in range(4):
-                b += EMOJIS[self.board[i][j]]
-                b += ' '
-            b += '\n\n'
-        return b + f'\n{Z}'
-
-    def is_game_over(self):
-        for i in range(4):
-            if 0 in self.board[i]:
-                return False
-        for direction in ['UP', 'DOWN', 'LEFT', 'RIGHT']:
-            if self.merge(direction, dry_run=True):
-                return False
-        return True
-
-    def merge(self, move, dry_run=False):
-        merged = False
-
-        if move == 'UP':
-            iterator = itertools.product(range(3), range(4))
-        if move == 'DOWN':
-            iterator = itertools.product(reversed(range(1, 4)), range(4))
-        if move == 'LEFT':
-            iterator = itertools.product(range(4), range(3))
-        if move == 'RIGHT':
-            iterator = itertools.product(range(4), reversed(range(1, 4)))
-
-        for row, col in iterator:
-            spot = self.board[row][col]
-
-            if spot != 0:
-                next_spots = {'UP': row + 1, 'DOWN': row - 1, 'LEFT': col + 1, 'RIGHT': col - 1}
-                next_i = next_spots[move]
-
-                if move in ['UP', 'DOWN']:
-                    next_spot = self.board[next_i][col]
-                    sp = (next_i, col)
-                if move in ['LEFT', 'RIGHT']:
-                    next_spot = self.board[row][next_i]
-                    sp = (row, next_i)
-
-                if next_spot == spot:
-                    merged = dry_run or self.merge_two(sp, (row, col))
-
-        return merged
-
-    def merge_two(self, what, into):
-        this_spot = self.board[into[0]][into[1]]
-
-        self.board[what[0]][what[1]] = 0
-        self.board[into[0]][into[1]] = this_spot * 2
-        self.score += this_spot * 2
-
-        return True
-
-    def shift(self, move):
-        moved = False
-
-        if move in ['UP', 'DOWN']:
-            for i in range(4):
-                # Create a new array based on the column
-                col = [row[i] for row in self.board]
-                # Push all the zeroes to either edges
-                new_col = sorted(col, key=lambda x: (1 if move is 'UP' else -1) if x == 0 else 0)
-
-                for j in range(4):
-                    self.board[j][i] = new_col[j]
-
-                if col != new_col:
-                    moved = True
-
-        if move in ['LEFT', 'RIGHT']:
-            for i in range(4):
-                row = self.board[i]
-                # Push all the zeroes to either ends
-                new_row = sorted(row, key=lambda x: (1 if move is 'LEFT' else -1) if x == 0 else 0)
-
-                self.board[i] = new_row
-                if row != new_row:
-                    moved = True
-
-        return moved
-
-    def insert_random(self):
-        num = random.choice([2, 2, 4])
-        choices = []
-
-        # Find all empty spaces
-        for row, col in itertools.product(range(4), range(4)):
-            if self.board[row][col] == 0:
-                choices.append((row, col))
-
-        if len(choices) == 0:
-            return False
-
-        # Fill in a random empty choice
-        row, col = random.choice(choices)
-        self.board[row][col] = num
-
-        return True
-
-
 class SubGame:
-    def __init__(self, player, channel):
-        self.board = Board()
+    def __init__(self, player, channel, rng):
+        self.engine = Game2048Engine(rng)
         self.player = player
         self.channel = channel
         self.board_msg = None
         self.game_over = False
 
     async def begin(self):
-        self.board.insert_random()
+        self.engine.insert_random()
 
         await self.update_message()
         await self.add_controls()
@@ -172,36 +52,54 @@ class SubGame:
         await self.update_message()
         await self.clear_controls()
 
+    def snapshot(self):
+        return {
+            **self.engine.serialize(),
+            'game_over': self.game_over,
+            'message': self.board_msg.id,
+        }
+
+    def restore(self, state, messages):
+        self.engine = Game2048Engine.deserialize(state, self.engine.random)
+        self.game_over = state['game_over']
+        self.board_msg = messages[state['message']]
+
     async def make_move(self, move):
         if self.game_over:
             return
 
         if move == 'FILL':
-            while True:
-                success = self.board.insert_random()
-                if not success:
-                    break
+            self.engine.fill()
             await self.update_message()
             return
 
-        moved, game_over = self.board.make_move(move)
-
-        if not moved:
+        try:
+            self.engine.apply(move)
+        except IllegalMove:
             return
 
         await self.update_message()
 
-        if game_over:
+        if self.engine.is_over():
             await self.end()
 
     async def update_message(self):
         if not self.board_msg:
-            self.board_msg = await self.channel.send(**self.render())
+            self.board_msg = await outbound.request(RENDER, route('send', self.channel), self.channel.send, **self.render())
         else:
-            await self.board_msg.edit(**self.render())
+            renderer.edit(self.board_msg, **self.render())
+
+    def render_board(self):
+        b = f'Score: {self.engine.score}\n\n'
+        for i in range(4):
+            for j in range(4):
+                b += EMOJIS[self.engine.get(i, j)]
+                b += ' '
+            b += '\n\n'
+        return b + f'\n{Z}'
 
     def render(self):
-        board_str = self.board.render_board()
+        board_str = self.render_board()
         board_str += f'{self.player.mention}'
 
         if self.game_over:
@@ -215,14 +113,13 @@ class SubGame:
         return {'embed': embed}
 
     async def add_controls(self):
-        for c in CONTROLS.keys():
-            await self.board_msg.add_reaction(c)
+        await controls.install(self.board_msg, CONTROLS.keys())
 
     async def clear_controls(self):
-        await self.board_msg.clear_reactions()
+        await remover.clear(self.board_msg)
 
 
-@register(name=GAME_NAME)
+@register(name=GAME_NAME, idle_timeout=30 * 60)
 class Game2048(BaseBotApp):
     def __init__(self, bot, players: list, channel: discord.TextChannel):
         super().__init__(GAME_NAME, players)
@@ -231,38 +128,61 @@ class Game2048(BaseBotApp):
         self.games = {}
 
         for player in players:
-            self.games[player.id] = SubGame(player, channel)
+            self.games[player.id] = SubGame(player, channel, self.random)
 
     async def begin(self):
+        await asyncio.gather(*(game.begin() for game in self.games.values()))
+
         for game in self.games.values():
-            await game.begin()
             self.register_message(game.board_msg)
 
+        self.mark_playable()
+
     async def end(self):
         score = 0
         winner = None
 
         for game in self.games.values():
             # TODO: handle ties
-            if game.board.score > score:
-                score = game.board.score
+            if game.engine.score > score:
+                score = game.engine.score
                 winner = game.player
 
             await game.end()
             self.unregister_message(game.board_msg)
 
         if winner and len(self.games.values()) > 1:
-            await self.channel.send(f'{winner.mention} has won with a score of {score}!')
+            await outbound.request(
+                RENDER, route('send', self.channel), self.channel.send,
+                f'{winner.mention} has won with a score of {score}!'
+            )
 
         self.end_session()
 
+    def snapshot(self):
+        return {
+            'games': [game.snapshot() for game in self.games.values()],
+            'seed': self.random_seed(),
+        }
+
+    @classmethod
+    async def restore(cls, bot, players, channel, messages, state):
+        app = cls(bot, players, channel)
+        messages = {message.id: message for message in messages}
+
+        for game, game_state in zip(app.games.values(), state['games']):
+            game.restore(game_state, messages)
+
+        app.random.seed(state['seed'])
+        return app
+
     async def handle(self, event, **data):
         if event == 'reaction':
             user = data.get('user')
             reaction = data.get('reaction')
 
             move = CONTROLS.get(reaction.emoji)
-            await reaction.remove(user)
+            remover.remove(reaction, user)
 
             if move and (user.id in self.games):
                 game = self.games[user.id]
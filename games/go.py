@@ -3,6 +3,8 @@ import random
 import string
 import copy
 
+from gamelib import controls
+
 class go():
     BOARD_X = 9
     BOARD_Y = 9
@@ -148,10 +150,10 @@ class go():
 
     async def refresh_buttons(self):
         if not self.winner and not self.has_buttons:
-            for emoji in self.BUTTONS_ROW.keys():
-                await self.message.add_reaction(emoji)
-            for emoji in self.BUTTONS_COL.keys():
-                await self.sub_message.add_reaction(emoji)
+            await controls.install_many([
+                (self.message, self.BUTTONS_ROW.keys()),
+                (self.sub_message, self.BUTTONS_COL.keys()),
+            ])
             self.has_buttons = True
         elif self.winner:
             await self.message.clear_reactions()
@@ -1,17 +1,18 @@
-import random
-import itertools
-
 import discord
 
-from gamelib import register
+from gamelib import register, renderer, controls, remover, outbound
+from gamelib.outbound import RENDER, route
 from gamelib.utils import BaseBotApp, GameConfigError, MagicMessage
 
+from engines.tictactoe import TicTacToeEngine
 from settings import Z
 
 GAME_NAME = 'tictactoe'
 CONTROLS = {'1️⃣':0, '2️⃣':1, '3️⃣':2, '🥇':3, '🥈':4, '🥉':5}
 REVERSE_ROW = {0:'1️⃣', 1:'2️⃣', 2: '3️⃣', None:'?'}
 REVERSE_COL = {0:'🥇', 1:'🥈', 2: '🥉', None:'?'}
+# Chance of the bot playing a random move instead of a perfect one
+MISTAKES = {'easy': 0.5, 'medium': 0.15, 'hard': 0.0}
 GAME_OVER = '\n:regional_indicator_g: :regional_indicator_a: :regional_indicator_m: :regional_indicator_e: :white_medium_small_square: :regional_indicator_o: :regional_indicator_v: :regional_indicator_e: :regional_indicator_r: '
 
 
@@ -30,19 +31,16 @@ class TicTacToe(BaseBotApp):
         self.channel = channel
         self.player1 = players[0]
         self.player2 = players[1]
-        self.board = [[None, None, None] for _ in range(3)]
+        self.players = [self.player1, self.player2]
+        self.engine = TicTacToeEngine(turn=self.random.randrange(2))
         self.board_msg = None
-        self.current_player = random.choice(players)
+        self.current_player = self.players[self.engine.turn]
 
         self.emojis = {
             None: ':white_large_square:',
             self.player1: ':negative_squared_cross_mark:',
             self.player2: ':blue_circle:'
         }
-        self.other = {
-            self.player1: self.player2,
-            self.player2: self.player1
-        }
 
         self.selected_row = None
         self.selected_col = None
@@ -58,6 +56,7 @@ class TicTacToe(BaseBotApp):
 
         await self.update_message()
         await self.add_controls()
+        self.mark_playable()
         await self.update_turn_message()
 
         self.register_message(self.board_msg)
@@ -73,13 +72,37 @@ class TicTacToe(BaseBotApp):
         self.unregister_message(self.board_msg)
         self.end_session()
 
+    def snapshot(self):
+        engine = self.engine.serialize()
+        return {
+            'board': engine['board'],
+            'current': engine['turn'],
+            'selected': [self.selected_row, self.selected_col],
+            'status': self.status_message,
+            'turn_message': self.turn_message.message_id,
+            'seed': self.random_seed(),
+        }
+
+    @classmethod
+    async def restore(cls, bot, players, channel, messages, state):
+        game = cls(bot, players, channel)
+        game.engine = TicTacToeEngine.deserialize({'board': state['board'], 'turn': state['current']})
+        game.current_player = players[state['current']]
+        game.selected_row, game.selected_col = state['selected']
+        game.status_message = state['status']
+        game.board_msg = messages[0]
+        game.turn_message = await MagicMessage.restore(channel, state['turn_message'])
+        game.random.seed(state['seed'])
+
+        return game
+
     async def handle(self, event, **data):
         if event == 'reaction':
             user = data.get('user')
             reaction = data.get('reaction')
 
             move = CONTROLS.get(reaction.emoji)
-            await reaction.remove(user)
+            remover.remove(reaction, user)
 
             if move != None and (user.id == self.current_player.id):
                 if self.status_message:
@@ -105,31 +128,42 @@ class TicTacToe(BaseBotApp):
                     await self.update_turn_message()
 
     async def play_move(self):
-        row, col = self.selected_row, self.selected_col
+        cell = self.selected_row * 3 + self.selected_col
 
-        if self.board[row][col] == None:
-            self.board[row][col] = self.current_player
-            self.current_player = self.other[self.current_player]
-        else:
+        if cell not in self.engine.legal_moves():
             self.status_message = ":x: That's taken, choose another spot!"
             return
 
+        self.apply_move(cell)
+
         self.selected_row = None
         self.selected_col = None
 
-        self.winner = self.check_winner()
-
     async def play_bot_move(self):
-        self.bot_move()
-        self.current_player = self.other[self.current_player]
-        self.winner = self.check_winner()
+        human = self.player1 if self.player2.id == self.bot.user.id else self.player2
+        difficulty = self.preference(human, 'difficulty', default='medium')
+
+        if self.random.random() < MISTAKES.get(difficulty, MISTAKES['medium']):
+            self.apply_move(self.random.choice(self.engine.legal_moves()))
+        else:
+            self.apply_move(self.random.choice(self.engine.best_moves()))
+
+    def apply_move(self, cell):
+        self.engine.apply(cell)
+
+        if self.engine.winner() is not None:
+            self.winner = self.players[self.engine.winner()]
+        elif self.engine.is_over():
+            self.winner = 'TIE'
+        else:
+            self.current_player = self.players[self.engine.turn]
 
     async def update_message(self):
         if self.board_msg:
-            await self.board_msg.edit(**self.render())
+            renderer.edit(self.board_msg, **self.render())
             return
 
-        self.board_msg = await self.channel.send(**self.render())
+        self.board_msg = await outbound.request(RENDER, route('send', self.channel), self.channel.send, **self.render())
 
     async def update_turn_message(self):
         await self.turn_message.send(f'{self.current_player.mention} it is your turn in Tic-Tac-Toe!')
@@ -159,7 +193,8 @@ class TicTacToe(BaseBotApp):
             board_str += REVERSE_ROW[row] + SPACER
             # Row content
             for col in range(3):
-                board_str += self.emojis[self.board[row][col]]
+                tile = self.engine.get(row, col)
+                board_str += self.emojis[None if tile is None else self.players[tile]]
                 if col != 2:
                     board_str += SPACER
             board_str += '\n\n'
@@ -188,45 +223,7 @@ class TicTacToe(BaseBotApp):
         return {'embed': embed}
 
     async def add_controls(self):
-        for c in CONTROLS.keys():
-            await self.board_msg.add_reaction(c)
+        await controls.install(self.board_msg, CONTROLS.keys())
 
     async def clear_controls(self):
-        await self.board_msg.clear_reactions()
-
-    def check_winner(self):
-        for row_i in range(3):
-            row = self.board[row_i]
-            if row[0] == row[1] and row[1] == row[2]:
-                if row[0] != None:
-                    return row[0]
-
-        for col_i in range(3):
-            if self.board[0][col_i] == self.board[1][col_i] and self.board[1][col_i] == self.board[2][col_i]:
-                if self.board[0][col_i] != None:
-                    return self.board[0][col_i]
-
-        if self.board[0][0] == self.board[1][1] and self.board[1][1] == self.board[2][2]:
-            if self.board[0][0] != None:
-                return self.board[0][0]
-
-        if self.board[0][2] == self.board[1][1] and self.board[1][1] == self.board[2][0]:
-            if self.board[0][2] != None:
-                return self.board[0][0]
-
-        for row_i in range(3):
-            if None in self.board[row_i]:
-                return None
-
-        return 'TIE'
-
-    def bot_move(self):
-        choices = []
-
-        for row, col in itertools.product(range(3), range(3)):
-            if self.board[row][col] == None:
-                choices.append((row, col))
-
-        row, col = random.choice(choices)
-
-        self.board[row][col] = self.bot.user
+        await remover.clear(self.board_msg)
@@ -28,6 +28,8 @@ end    End a game
 prefs  Get your preferences
 ``` ```
 set    Edit your preferences
+``` ```
+default  Edit server defaults
 ```
 :rocket: **More**
 
@@ -0,0 +1,4 @@
+import os
+
+# Importing gamelib opens the bot's database, keep it out of the working tree
+os.environ.setdefault('GAMEBOT_DATABASE', 'sqlite::memory:')
@@ -0,0 +1,79 @@
+from gamelib import cache
+from gamelib.cache import LRUCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_evicts_least_recently_used():
+    lru = LRUCache(2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    # Reading 'a' makes 'b' the oldest
+    assert lru.get('a') == 1
+    lru.set('c', 3)
+
+    assert 'b' not in lru
+    assert lru.get('a') == 1 and lru.get('c') == 3
+    assert len(lru) == 2
+
+
+def test_set_refreshes():
+    lru = LRUCache(2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.set('a', 10)
+    lru.set('c', 3)
+
+    assert lru.get('a') == 10
+    assert 'b' not in lru
+
+
+def test_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'time', clock)
+
+    lru = LRUCache(10, ttl=5)
+    lru.set('a', 1)
+    clock.now += 4
+    assert lru.get('a') == 1
+
+    clock.now += 2
+    assert lru.get('a', 'gone') == 'gone'
+    assert 'a' not in lru
+
+    # Setting again restarts the time to live
+    lru.set('a', 2)
+    clock.now += 4
+    assert lru.get('a') == 2
+
+
+def test_no_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'time', clock)
+
+    lru = LRUCache(10)
+    lru.set('a', 1)
+    clock.now += 10 ** 9
+    assert lru.get('a') == 1
+
+
+def test_invalidate_clear_and_stats():
+    lru = LRUCache(10)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.get('x')
+
+    lru.invalidate('a')
+    lru.invalidate('missing')
+    assert lru.get('a') is None
+    assert lru.stats() == {'size': 1, 'hits': 1, 'misses': 2}
+
+    lru.clear()
+    assert len(lru) == 0
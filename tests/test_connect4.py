@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from engines.base import IllegalMove
+from engines.connect4 import WIDTH, HEIGHT, Connect4Engine
+
+from benchmarks.baseline import ListConnect4Engine
+
+
+def same(engine, baseline):
+    assert engine.legal_moves() == baseline.legal_moves()
+    assert engine.turn == baseline.turn
+    assert engine.winner() == baseline.winner()
+    assert engine.is_over() == baseline.is_over()
+    assert engine.serialize() == baseline.serialize()
+    assert all(
+        engine.get(row, col) == baseline.get(row, col)
+        for row in range(HEIGHT) for col in range(WIDTH)
+    )
+
+
+def test_matches_list_engine():
+    rng = random.Random(1)
+
+    for _ in range(2000):
+        engine, baseline = Connect4Engine(), ListConnect4Engine()
+        while not baseline.is_over():
+            col = rng.choice(baseline.legal_moves())
+            engine.apply(col)
+            baseline.apply(col)
+            same(engine, baseline)
+
+        same(Connect4Engine.deserialize(engine.serialize()), baseline)
+
+
+def test_full_board_is_a_draw():
+    engine = Connect4Engine()
+    for col in '361313645534311043046626105524515600224220':
+        assert not engine.is_over()
+        engine.apply(int(col))
+
+    assert engine.is_over()
+    assert engine.winner() is None
+    assert engine.turn is None
+    assert engine.legal_moves() == []
+
+
+def test_illegal_moves():
+    engine = Connect4Engine()
+    for _ in range(HEIGHT):
+        engine.apply(0)
+
+    with pytest.raises(IllegalMove):
+        engine.apply(0)
+    with pytest.raises(IllegalMove):
+        engine.apply(WIDTH)
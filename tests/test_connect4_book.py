@@ -0,0 +1,61 @@
+from engines.connect4 import WIDTH, Connect4Engine
+from engines.connect4_book import OpeningBook, canonical, mirror, position_key, write
+
+
+def play(moves):
+    engine = Connect4Engine()
+    for col in moves:
+        engine.apply(col)
+    return engine
+
+
+def test_mirror():
+    engine, mirrored = play([0, 1, 1, 5]), play([6, 5, 5, 1])
+
+    assert mirror(position_key(engine.masks, engine.turn)) == position_key(mirrored.masks, mirrored.turn)
+    assert canonical(engine)[0] == canonical(mirrored)[0]
+    assert canonical(engine)[1] != canonical(mirrored)[1]
+
+
+def test_keys_are_unique():
+    keys = {}
+    frontier = [Connect4Engine()]
+
+    for _ in range(5):
+        following = []
+        for engine in frontier:
+            for col in engine.legal_moves():
+                child = engine.clone()
+                child.apply(col)
+                keys[str(child.serialize())] = position_key(child.masks, child.turn)
+                following.append(child)
+        frontier = following
+
+    assert len(set(keys.values())) == len(keys)
+
+
+def test_lookup(tmp_path):
+    path = str(tmp_path / 'test.book')
+    entries = {}
+    for moves, col in (([], 3), ([0], 2), ([3, 3], 4)):
+        key, flipped = canonical(play(moves))
+        entries[key] = WIDTH - 1 - col if flipped else col
+    write(path, entries, 2)
+
+    book = OpeningBook(path)
+    try:
+        assert len(book) == 3
+        assert book.lookup(play([])) == 3
+        assert book.lookup(play([0])) == 2
+        # The mirror image shares the record, with the column mirrored back
+        assert book.lookup(play([6])) == 4
+        assert book.lookup(play([3, 3])) == 4
+        assert book.lookup(play([1])) is None
+        # Past the book's plies
+        assert book.lookup(play([3, 3, 3])) is None
+    finally:
+        book.close()
+
+
+def test_missing_book(tmp_path):
+    assert OpeningBook.open(str(tmp_path / 'missing.book')) is None
@@ -0,0 +1,91 @@
+import random
+
+from engines.connect4 import WIDTH, HEIGHT, TOP, Connect4Engine, connects
+from engines.connect4_search import ORDER, WIN, Searcher, key
+
+
+def minimax(searcher, player, depth):
+    '''
+    The searcher's scoring, without pruning or the transposition table.
+    '''
+    if searcher.moves == WIDTH * HEIGHT:
+        return 0
+
+    masks, heights = searcher.masks, searcher.heights
+    mine = masks[player]
+
+    for col in ORDER:
+        if heights[col] != TOP[col] and connects(mine | 1 << heights[col]):
+            return WIN - searcher.moves - 1
+
+    if depth == 0:
+        return searcher._evaluate(player)
+
+    best = -WIN
+    for col in ORDER:
+        bit = heights[col]
+        if bit == TOP[col]:
+            continue
+
+        masks[player] = mine | 1 << bit
+        heights[col] += 1
+        searcher.moves += 1
+        best = max(best, -minimax(searcher, 1 - player, depth - 1))
+        masks[player] = mine
+        heights[col] -= 1
+        searcher.moves -= 1
+
+    return best
+
+
+def positions(count, seed=2):
+    rng = random.Random(seed)
+    found = []
+
+    while len(found) < count:
+        engine = Connect4Engine()
+        for _ in range(rng.randrange(WIDTH * HEIGHT)):
+            if engine.is_over():
+                break
+            engine.apply(rng.choice(engine.legal_moves()))
+        if not engine.is_over():
+            found.append(engine)
+
+    return found
+
+
+def searcher_at(engine):
+    # A fresh table, so no deeper results from earlier searches are reused
+    searcher = Searcher()
+    searcher.deadline = float('inf')
+    searcher.masks = engine.masks[:]
+    searcher.heights = engine.heights[:]
+    searcher.moves = engine.moves
+    return searcher
+
+
+def test_alpha_beta_matches_minimax():
+    for engine in positions(150):
+        for depth in (1, 2, 3, 4):
+            pruned = searcher_at(engine)._negamax(engine.turn, key(engine), depth, -WIN, WIN)[0]
+            plain = minimax(searcher_at(engine), engine.turn, depth)
+            assert pruned == plain
+
+
+def play(moves):
+    engine = Connect4Engine()
+    for col in moves:
+        engine.apply(col)
+    return engine
+
+
+def test_takes_a_win():
+    # Player 0 has three in the bottom row
+    engine = play([0, 0, 1, 1, 2, 2])
+    assert Searcher().search(engine, 4, 1.0)[0] == 3
+
+
+def test_blocks_a_win():
+    # Player 1 has three in column 6, and player 0 has no win of its own
+    engine = play([0, 6, 2, 6, 4, 6])
+    assert Searcher().search(engine, 4, 1.0)[0] == 6
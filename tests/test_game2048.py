@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from engines.base import IllegalMove
+from engines.game2048 import Game2048Engine, slide
+
+
+def test_slide():
+    assert slide([0, 0, 0, 0]) == ([0, 0, 0, 0], 0)
+    assert slide([0, 2, 0, 2]) == ([4, 0, 0, 0], 4)
+    assert slide([2, 2, 2, 2]) == ([4, 4, 0, 0], 8)
+    assert slide([2, 2, 4, 0]) == ([4, 4, 0, 0], 4)
+    assert slide([4, 4, 8, 16]) == ([8, 8, 16, 0], 8)
+    assert slide([2, 4, 2, 4]) == ([2, 4, 2, 4], 0)
+
+
+def test_moves():
+    engine = Game2048Engine.deserialize({'board': [
+        2, 2, 0, 0,
+        0, 0, 0, 0,
+        0, 0, 0, 0,
+        0, 0, 0, 2,
+    ], 'score': 0}, random.Random(5))
+
+    assert sorted(engine.legal_moves()) == ['DOWN', 'LEFT', 'RIGHT', 'UP']
+    engine.apply('LEFT')
+    assert engine.score == 4
+    assert engine.get(0, 0) == 4 and engine.get(3, 0) == 2
+    # The new random tile
+    assert sum(1 for cell in engine.cells if cell) == 3
+
+
+def test_stuck_move_is_illegal():
+    engine = Game2048Engine.deserialize({'board': [
+        2, 4, 0, 0,
+        0, 0, 0, 0,
+        0, 0, 0, 0,
+        0, 0, 0, 0,
+    ], 'score': 0})
+
+    assert 'LEFT' not in engine.legal_moves() and 'UP' not in engine.legal_moves()
+    with pytest.raises(IllegalMove):
+        engine.apply('LEFT')
+
+
+def test_game_ends():
+    rng = random.Random(6)
+    engine = Game2048Engine(rng)
+    engine.insert_random()
+
+    while not engine.is_over():
+        engine.apply(rng.choice(engine.legal_moves()))
+
+    assert 0 not in engine.cells
+    assert engine.legal_moves() == []
@@ -0,0 +1,98 @@
+import asyncio
+
+from gamelib.database import AsyncDatabase, SQLiteDatabase, WriteBehind
+from gamelib.preferences import Preferences, Preference, GLOBAL
+from gamelib.timers import TimingWheel
+
+
+class Player:
+    def __init__(self, id):
+        self.id = id
+
+
+class Guild:
+    def __init__(self, id):
+        self.id = id
+
+
+def preferences():
+    db = AsyncDatabase(SQLiteDatabase(':memory:'))
+    prefs = Preferences(db, WriteBehind(db, TimingWheel()))
+    prefs.register(GLOBAL, {'emoji': Preference('Piece', default='G'), 'color': Preference('Color')})
+    prefs.register('go', {'komi': Preference('Komi', default='6.5')})
+    return prefs
+
+
+def run(main):
+    return asyncio.run(main())
+
+
+def test_resolve_layers():
+    prefs = preferences()
+
+    player = {GLOBAL: {'emoji': 'player global'}, 'go': {'komi': 'player go'}}
+    guild = {GLOBAL: {'emoji': 'guild global', 'color': 'guild color'}, 'go': {'emoji': 'guild go', 'komi': 'guild go'}}
+
+    # A player's own settings win over the guild's, per-game over global
+    assert prefs.resolve('go', player, guild) == {'emoji': 'player global', 'color': 'guild color', 'komi': 'player go'}
+    assert prefs.resolve('go', {}, guild) == {'emoji': 'guild go', 'color': 'guild color', 'komi': 'guild go'}
+    assert prefs.resolve('go', {'go': {'emoji': 'player go'}}, guild)['emoji'] == 'player go'
+    # Unset keys are None, defaults are applied on lookup
+    assert prefs.resolve('go', {}, {}) == {'emoji': None, 'color': None, 'komi': None}
+    # Settings of other games don't leak in
+    assert 'komi' not in prefs.resolve('connect4', player, guild)
+
+
+def test_lookup_defaults():
+    prefs = preferences()
+    player = Player(1)
+
+    async def main():
+        assert await prefs.aget(player, 'go', 'emoji') == 'G'
+        assert await prefs.aget(player, 'go', 'komi') == '6.5'
+        assert await prefs.aget(player, 'go', 'color') is None
+        assert await prefs.aget(player, 'go', 'color', default='x') == 'x'
+
+    run(main)
+
+
+def test_cached_resolution_follows_writes():
+    prefs = preferences()
+    player, other, guild = Player(1), Player(2), Guild(100)
+
+    async def main():
+        assert await prefs.aget(player, 'go', 'emoji', guild=guild) == 'G'
+        assert await prefs.aget(other, 'go', 'emoji', guild=guild) == 'G'
+
+        await prefs.aset_guild(guild, GLOBAL, 'emoji', 'guild')
+        assert await prefs.aget(player, 'go', 'emoji', guild=guild) == 'guild'
+        assert await prefs.aget(other, 'go', 'emoji', guild=guild) == 'guild'
+        # Without the guild, its defaults don't apply
+        assert await prefs.aget(player, 'go', 'emoji') == 'G'
+
+        await prefs.aset(player, GLOBAL, 'emoji', 'mine')
+        assert await prefs.aget(player, 'go', 'emoji', guild=guild) == 'mine'
+        assert await prefs.aget(other, 'go', 'emoji', guild=guild) == 'guild'
+        assert prefs.get(player, 'go', 'emoji', guild=guild) == 'mine'
+
+        await prefs.aset(player, GLOBAL, 'emoji', None)
+        assert await prefs.aget(player, 'go', 'emoji', guild=guild) == 'guild'
+
+    run(main)
+
+
+def test_view_matches_lookups():
+    prefs = preferences()
+    players, guild = [Player(1), Player(2)], Guild(100)
+
+    async def main():
+        await prefs.aset(players[0], 'go', 'komi', '7.5')
+        await prefs.aset(players[1], GLOBAL, 'color', 'red')
+        await prefs.aset_guild(guild, GLOBAL, 'emoji', 'guild')
+
+        view = await prefs.view('go', players, guild)
+        for player in players:
+            for key in ('emoji', 'color', 'komi'):
+                assert view.get(player, key) == await prefs.aget(player, 'go', key, guild=guild)
+
+    run(main)
@@ -0,0 +1,140 @@
+import random
+
+from collections import defaultdict, Counter
+
+from gamelib.session import SessionManager
+from gamelib.timers import TimingWheel
+
+
+class Player:
+    def __init__(self, id):
+        self.id = id
+
+
+class Guild:
+    def __init__(self, id):
+        self.id = id
+
+
+class Channel:
+    def __init__(self, id, guild=None):
+        self.id = id
+        self.guild = guild
+
+
+class Message:
+    def __init__(self, id):
+        self.id = id
+
+
+class App:
+    def __init__(self, name, channel=None):
+        self.app_name = name
+        self.channel = channel
+
+
+def manager():
+    return SessionManager(None, TimingWheel(), None)
+
+
+def check(sessions):
+    '''
+    Every index must match what the records say.
+    '''
+    records = sessions._records
+    players, channels, guilds = defaultdict(set), defaultdict(set), defaultdict(set)
+    messages = dict()
+
+    for app, record in records.items():
+        assert sessions._sessions[record.key] is app
+        for player_id in record.key:
+            players[player_id].add(app)
+        if record.channel_id is not None:
+            channels[record.channel_id].add(app)
+        if record.guild_id is not None:
+            guilds[record.guild_id].add(app)
+        for message_id in record.messages:
+            messages[message_id] = app
+
+    assert len(sessions._sessions) == len(records)
+    assert dict(sessions._players) == players
+    assert dict(sessions._channels) == channels
+    assert dict(sessions._guilds) == guilds
+    assert sessions._messages == messages
+    assert sessions._game_counts == Counter(app.app_name for app in records)
+    assert sessions._guild_counts == Counter(r.guild_id for r in records.values() if r.guild_id is not None)
+
+
+def test_add_get_pop():
+    sessions = manager()
+    a, b, c = Player(1), Player(2), Player(3)
+    app = App('connect4', Channel(10, Guild(100)))
+
+    assert sessions.add([a, b], app)
+    assert not sessions.add([b, a], App('connect4'))
+    assert sessions.get([b, a]) is app
+    assert sessions.get([a, c]) is None
+    assert sessions.get_player_sessions(a) == {app}
+    assert sessions.get_channel_sessions(Channel(10)) == {app}
+    assert sessions.get_guild_sessions(Guild(100)) == {app}
+    assert sessions.counts() == {'sessions': 1, 'messages': 0, 'games': {'connect4': 1}, 'guilds': {100: 1}}
+
+    assert sessions.pop([a, b]) is app
+    assert sessions.pop([a, b]) is None
+    assert len(sessions) == 0
+    check(sessions)
+
+
+def test_messages():
+    sessions = manager()
+    app, other = App('go'), App('go')
+    sessions.add([Player(1)], app)
+
+    assert sessions.register_message(Message(5), app)
+    # Untracked sessions don't get their messages indexed
+    assert not sessions.register_message(Message(6), other)
+    assert sessions.get_message_session(Message(5)) is app
+    assert sessions.get_message_session(Message(6)) is None
+    assert [m.id for m in sessions.get_app_messages(app)] == [5]
+
+    assert sessions.unregister_message(Message(5))
+    assert not sessions.unregister_message(Message(5))
+
+    sessions.register_message(Message(7), app)
+    sessions.remove(app)
+    assert sessions.get_message_session(Message(7)) is None
+    check(sessions)
+
+
+def test_indexes_stay_consistent():
+    rng = random.Random(8)
+    sessions = manager()
+    guilds = [Guild(100), Guild(101), None]
+    channels = [Channel(10 + i, rng.choice(guilds)) for i in range(5)] + [None]
+    message_ids = iter(range(1000, 100000))
+
+    for _ in range(3000):
+        op = rng.random()
+        apps = sessions.all()
+
+        if op < 0.4 or not apps:
+            players = [Player(id) for id in rng.sample(range(20), rng.randint(1, 3))]
+            sessions.add(players, App(rng.choice(['go', 'connect4', 'tictactoe']), rng.choice(channels)))
+        elif op < 0.6:
+            sessions.register_message(Message(next(message_ids)), rng.choice(apps))
+        elif op < 0.7:
+            messages = sessions.get_app_messages(rng.choice(apps))
+            if messages:
+                sessions.unregister_message(rng.choice(messages))
+        elif op < 0.9:
+            sessions.remove(rng.choice(apps))
+        else:
+            sessions.pop([Player(id) for id in sessions._records[rng.choice(apps)].key])
+
+        check(sessions)
+
+    for app in sessions.all():
+        sessions.remove(app)
+
+    check(sessions)
+    assert not sessions._players and not sessions._channels and not sessions._guilds
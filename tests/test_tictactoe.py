@@ -0,0 +1,61 @@
+import random
+
+from engines.tictactoe import TABLE, TicTacToeEngine
+
+from benchmarks.baseline import ListTicTacToeEngine
+
+
+def same(engine, baseline):
+    assert engine.legal_moves() == baseline.legal_moves()
+    assert engine.turn == baseline.turn
+    assert engine.winner() == baseline.winner()
+    assert engine.is_over() == baseline.is_over()
+    assert engine.serialize() == baseline.serialize()
+    assert all(engine.get(row, col) == baseline.get(row, col) for row in range(3) for col in range(3))
+
+
+def test_matches_list_engine():
+    rng = random.Random(3)
+
+    for _ in range(20000):
+        engine, baseline = TicTacToeEngine(), ListTicTacToeEngine()
+        while not baseline.is_over():
+            cell = rng.choice(baseline.legal_moves())
+            engine.apply(cell)
+            baseline.apply(cell)
+            same(engine, baseline)
+
+        same(TicTacToeEngine.deserialize(engine.serialize()), baseline)
+
+
+def test_table():
+    assert len(TABLE) == 5478
+    assert TicTacToeEngine().value() == 0
+    assert TicTacToeEngine().best_moves()
+
+
+def play(first, second, rng):
+    engine = TicTacToeEngine()
+    players = (first, second)
+    while not engine.is_over():
+        engine.apply(players[engine.turn](engine, rng))
+    return engine.winner()
+
+
+def perfect(engine, rng):
+    return rng.choice(engine.best_moves())
+
+
+def anything(engine, rng):
+    return rng.choice(engine.legal_moves())
+
+
+def test_perfect_play_never_loses():
+    rng = random.Random(4)
+
+    for _ in range(2000):
+        assert play(perfect, anything, rng) != 1
+        assert play(anything, perfect, rng) != 0
+
+    for _ in range(200):
+        assert play(perfect, perfect, rng) is None
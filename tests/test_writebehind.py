@@ -0,0 +1,153 @@
+import asyncio
+
+from gamelib.database import WriteBehind
+from gamelib.timers import TimingWheel
+
+
+class Storage:
+    '''
+    Stands in for AsyncDatabase. Commits can be held back with `gate` and
+    made to fail with `failures`.
+    '''
+
+    def __init__(self):
+        self.batches = []
+        self.failures = 0
+        self.gate = None
+
+    async def set_many(self, items):
+        if self.gate:
+            await self.gate.wait()
+        if self.failures:
+            self.failures -= 1
+            raise OSError('disk full')
+        self.batches.append(dict(items))
+
+    def committed(self):
+        data = dict()
+        for batch in self.batches:
+            data.update(batch)
+        return data
+
+
+def run(main):
+    return asyncio.run(main())
+
+
+def test_merges_and_commits_after_delay():
+    storage = Storage()
+
+    async def main():
+        writer = WriteBehind(storage, TimingWheel(tick=0.01), max_delay=0.05)
+        writer.set(1, 'a')
+        writer.set(1, 'b')
+        writer.set(2, 'c')
+        assert writer.get(1) == 'b'
+        assert storage.batches == []
+
+        await asyncio.sleep(0.15)
+        assert storage.batches == [{1: 'b', 2: 'c'}]
+        assert writer.get(1) is None
+        assert writer.stats() == {'pending': 0, 'merged': 1, 'batches': 1, 'written': 2}
+
+    run(main)
+
+
+def test_full_batch_commits_at_once():
+    storage = Storage()
+
+    async def main():
+        writer = WriteBehind(storage, TimingWheel(tick=0.01), max_batch=3, max_delay=60)
+        for id in range(3):
+            writer.set(id, id)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert storage.batches == [{0: 0, 1: 1, 2: 2}]
+
+    run(main)
+
+
+def test_in_flight_writes_are_readable():
+    storage = Storage()
+
+    async def main():
+        storage.gate = asyncio.Event()
+        writer = WriteBehind(storage, TimingWheel(tick=0.01))
+        writer.set(1, 'a')
+
+        flush = asyncio.ensure_future(writer.flush())
+        await asyncio.sleep(0)
+        assert writer.stats()['pending'] == 0
+        assert writer.get(1) == 'a'
+
+        storage.gate.set()
+        await flush
+        assert writer.get(1) is None
+
+    run(main)
+
+
+def test_failed_commit_is_retried():
+    storage = Storage()
+
+    async def main():
+        storage.failures = 1
+        writer = WriteBehind(storage, TimingWheel(tick=0.01), max_delay=0.05)
+        writer.set(1, 'a')
+
+        await writer.flush()
+        assert storage.batches == []
+        assert writer.get(1) == 'a'
+
+        await asyncio.sleep(0.15)
+        assert storage.committed() == {1: 'a'}
+        assert writer.stats()['batches'] == 1
+
+    run(main)
+
+
+def test_failed_commit_keeps_newer_write():
+    storage = Storage()
+
+    async def main():
+        storage.gate = asyncio.Event()
+        storage.failures = 1
+        writer = WriteBehind(storage, TimingWheel(tick=0.01), max_delay=0.05)
+        writer.set(1, 'old')
+        writer.set(2, 'other')
+
+        flush = asyncio.ensure_future(writer.flush())
+        await asyncio.sleep(0)
+        # Written while the failing batch is out
+        writer.set(1, 'new')
+        storage.gate.set()
+        await flush
+
+        assert writer.get(1) == 'new'
+        await asyncio.sleep(0.15)
+        assert storage.committed() == {1: 'new', 2: 'other'}
+
+    run(main)
+
+
+def test_newer_write_survives_older_commit():
+    storage = Storage()
+
+    async def main():
+        storage.gate = asyncio.Event()
+        writer = WriteBehind(storage, TimingWheel(tick=0.01), max_delay=0.05)
+        writer.set(1, 'old')
+
+        first = asyncio.ensure_future(writer.flush())
+        await asyncio.sleep(0)
+        writer.set(1, 'new')
+        second = asyncio.ensure_future(writer.flush())
+        await asyncio.sleep(0)
+        assert writer.get(1) == 'new'
+
+        storage.gate.set()
+        await asyncio.gather(first, second)
+        assert storage.batches == [{1: 'old'}, {1: 'new'}]
+        assert writer.get(1) is None
+
+    run(main)
@@ -0,0 +1,87 @@
+'''
+Build the connect 4 opening book.
+
+    python -m tools.connect4_book --plies 6 --budget 0.5
+
+Every position reachable in the first `--plies` moves (mirror images
+counted once) is searched for up to `--depth` plies or `--budget` seconds,
+on every core, and the best moves are written to `--output`. The bot reads
+the book from GAMEBOT_CONNECT4_BOOK, by default books/connect4.book.
+
+The bot only plays from the book on medium, so the book has to search at
+least as deep and as long as medium does (GameConnect4.DIFFICULTY).
+'''
+import os
+import time
+import argparse
+
+from multiprocessing import Pool
+
+from engines.connect4 import WIDTH, Connect4Engine
+from engines.connect4_search import best_move
+from engines import connect4_book
+
+
+def positions(plies):
+    '''
+    {canonical key: engine} for every unfinished position in the first
+    `plies` moves.
+    '''
+    found = dict()
+    frontier = [Connect4Engine()]
+
+    for ply in range(plies + 1):
+        following = []
+        for engine in frontier:
+            key, _ = connect4_book.canonical(engine)
+            if key in found or engine.is_over():
+                continue
+
+            found[key] = engine
+            for col in engine.legal_moves():
+                child = engine.clone()
+                child.apply(col)
+                following.append(child)
+        frontier = following
+
+    return found
+
+
+def search(args):
+    key, engine, depth, budget = args
+    col, _ = best_move(engine, depth, budget)
+
+    # Store the move for the canonical orientation
+    _, flipped = connect4_book.canonical(engine)
+    return key, WIDTH - 1 - col if flipped else col
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--plies', type=int, default=6)
+    parser.add_argument('--depth', type=int, default=16)
+    parser.add_argument('--budget', type=float, default=0.5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', default=os.path.join('books', 'connect4.book'))
+    args = parser.parse_args()
+
+    found = positions(args.plies)
+    print(f'Searching {len(found)} positions, about {len(found) * args.budget / args.workers / 60:.0f} minutes at most')
+
+    entries = dict()
+    start = time.perf_counter()
+    jobs = [(key, engine, args.depth, args.budget) for key, engine in found.items()]
+
+    with Pool(args.workers) as pool:
+        for key, col in pool.imap_unordered(search, jobs, chunksize=16):
+            entries[key] = col
+            if len(entries) % 500 == 0:
+                print(f'{len(entries)}/{len(found)} in {time.perf_counter() - start:.0f}s')
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    connect4_book.write(args.output, entries, args.plies)
+    print(f'Wrote {len(entries)} moves to {args.output} in {time.perf_counter() - start:.0f}s')
+
+
+if __name__ == '__main__':
+    main()